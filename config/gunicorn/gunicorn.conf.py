@@ -0,0 +1,12 @@
+# ASGI counterpart of config/uwsgi/uwsgi.ini, served by nginx on port 8443
+# so both can be load tested side by side. BLOG_ASYNC_VIEWS switches the
+# read-only blog pages to blog.async_views.
+chdir = '/code/problog'
+wsgi_app = 'problog.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+# uWSGI runs a single worker as well.
+workers = 1
+bind = 'unix:/code/problog/asgi_app.sock'
+umask = 0o000
+user = 'www-data'
+group = 'www-data'
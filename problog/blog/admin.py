@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from blog.models import Post, Comment
+from blog.models import Post, Comment, OutboundEmail
 
 
 
@@ -13,6 +13,7 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'publish',
         'status',
+        'active_comment_count',
     ]
     list_filter = ['status', 'created', 'publish', 'author']
     search_fields = ['title', 'body']
@@ -26,4 +27,23 @@ class PostAdmin(admin.ModelAdmin):
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'post', 'created', 'active']
     list_filter = ['active', 'created', 'updated']
-    search_fields = ['name', 'email', 'body']
\ No newline at end of file
+    search_fields = ['name', 'email', 'body']
+    actions = ['approve_comments', 'disapprove_comments']
+
+    @admin.action(description='Approve selected comments')
+    def approve_comments(self, request, queryset):
+        updated = queryset.set_active(True)
+        self.message_user(request, f'{updated} comments were approved.')
+
+    @admin.action(description='Disapprove selected comments')
+    def disapprove_comments(self, request, queryset):
+        updated = queryset.set_active(False)
+        self.message_user(request, f'{updated} comments were disapproved.')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt', 'created', 'sent']
+    list_filter = ['status', 'created']
+    search_fields = ['subject']
+    readonly_fields = ['attempts', 'last_error', 'created', 'sent']
\ No newline at end of file
@@ -0,0 +1,156 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import aget_object_or_404, render
+from django.utils.http import urlencode
+from django.views.decorators.vary import vary_on_cookie
+from taggit.models import Tag
+
+from blog.conditional import post_detail_condition, post_list_condition
+from blog.feeds import LatestPostsFeed, TagPostsFeed, feed_condition
+from blog.forms import CommentForm, SearchForm
+from blog.models import Post
+from blog.pagecache import cache_anonymous_page
+from blog.templatetags.blogtags import (
+    get_most_commented_posts,
+    show_latest_posts,
+    total_posts,
+)
+from blog.views import (
+    get_similar_posts,
+    paginate_comments,
+    paginate_posts,
+    paginate_results,
+)
+
+
+# What the sidebar of base.html shows. Loading it alongside a page's own
+# queries fills the cache its template tags read from.
+SIDEBAR_QUERIES = (
+    total_posts,
+    partial(show_latest_posts, 3),
+    get_most_commented_posts,
+)
+
+
+def run_query(query):
+    # Worker threads hold their own connection, reused for CONN_MAX_AGE. With
+    # the default of 0 every query would open and close one.
+    close_old_connections()
+    try:
+        return query()
+    finally:
+        close_old_connections()
+
+
+async def gather(*queries):
+    # Django's async ORM runs every query on the thread that owns the
+    # request's connection, so they would still wait for each other.
+    if settings.BLOG_ASYNC_PARALLEL_QUERIES:
+        run = sync_to_async(run_query, thread_sensitive=False)
+        return await asyncio.gather(*(run(query) for query in queries))
+    return await asyncio.gather(*(sync_to_async(query)() for query in queries))
+
+
+def loaded(page):
+    # Evaluates the page's rows now instead of while rendering.
+    len(page)
+    return page
+
+
+async def render_page(request, template_name, context):
+    # Templates are synchronous and may still query, e.g. for the session.
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@post_list_condition
+@cache_anonymous_page
+async def post_list(request, tag_slug=None):
+    post_list = Post.published.for_listing()
+    tag = None
+    if tag_slug:
+        tag = await aget_object_or_404(Tag, slug=tag_slug)
+        post_list = post_list.filter(tags__in=[tag])
+    posts, *sidebar = await gather(
+        lambda: loaded(paginate_posts(request, post_list)),
+        *SIDEBAR_QUERIES
+    )
+    return await render_page(
+        request,
+        'blog/post/list.html',
+        {
+            'posts': posts,
+            'tag': tag,
+        }
+    )
+
+
+@vary_on_cookie
+@post_detail_condition
+@cache_anonymous_page
+async def post_detail(request, year, month, day, post):
+    post = await aget_object_or_404(
+        Post,
+        status=Post.Status.PUBLISHED,
+        publish__year=year,
+        publish__month=month,
+        publish__day=day,
+        slug=post
+    )
+    comments, similar_posts, *sidebar = await gather(
+        partial(paginate_comments, post.comments.filter(active=True)),
+        partial(get_similar_posts, post),
+        *SIDEBAR_QUERIES
+    )
+    return await render_page(
+        request,
+        'blog/post/detail.html',
+        {
+            'post': post,
+            'comments': comments,
+            'form': CommentForm(),
+            'similar_posts': similar_posts,
+        }
+    )
+
+
+async def post_search(request):
+    form = SearchForm()
+    query = None
+    results = []
+    getvars = ''
+    if 'query' in request.GET:
+        form = SearchForm(data=request.GET)
+        if form.is_valid():
+            query = form.cleaned_data['query']
+            results, *sidebar = await gather(
+                lambda: loaded(paginate_results(request, query)),
+                *SIDEBAR_QUERIES
+            )
+            getvars = f'&{urlencode({"query": query})}'
+    return await render_page(
+        request,
+        'blog/post/search.html',
+        {
+            'query': query,
+            'form': form,
+            'results': results,
+            'getvars': getvars,
+        }
+    )
+
+
+def feed_view(feed):
+    # The syndication framework is synchronous, feeds are rendered in a
+    # thread once the validators are known. Cached feeds skip rendering.
+    @feed_condition
+    async def view(request, *args, **kwargs):
+        return await sync_to_async(feed)(request, *args, **kwargs)
+    return view
+
+
+post_feed = feed_view(LatestPostsFeed())
+post_feed_by_tag = feed_view(TagPostsFeed())
@@ -0,0 +1,130 @@
+import statistics
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from taggit.models import Tag
+
+from blog.instrumentation import percentile
+from blog.models import Post
+from blog.views import paginate_comments
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def benchmark_routes():
+    # Every route of blog.urls and the sitemap, pointed at the busiest post
+    # and tag so the numbers reflect the heaviest pages.
+    post = Post.published.order_by('-active_comment_count', 'id').first()
+    tag = Tag.objects.annotate(
+        total=Count('taggit_taggeditem_items')
+    ).order_by('-total', 'id').first()
+    if post is None or tag is None:
+        raise BenchmarkError('There are no published, tagged posts to request, seed the database first.')
+    comments = paginate_comments(post.comments.filter(active=True))
+    comment_page = reverse('blog:post_comments', args=[post.id])
+    if comments.next_cursor:
+        comment_page += f'?{urlencode({"after": comments.next_cursor})}'
+    search = urlencode({'query': post.title.split()[0]})
+    section = post.id // settings.BLOG_SITEMAP_SECTION_SIZE
+    pages = [
+        ('post_list', reverse('blog:post_list')),
+        ('post_list_by_tag', reverse('blog:post_list_by_tag', args=[tag.slug])),
+        ('post_detail', post.get_absolute_url()),
+        ('post_comments', comment_page),
+        ('post_share', reverse('blog:post_share', args=[post.id])),
+        ('post_feed', reverse('blog:post_feed')),
+        ('post_feed_by_tag', reverse('blog:post_feed_by_tag', args=[tag.slug])),
+        ('post_search', f'{reverse("blog:post_search")}?{search}'),
+        ('sitemap', reverse('sitemap')),
+        ('sitemap_section', reverse('sitemap_section', args=[section])),
+    ]
+    comment = {
+        'name': 'Benchmark',
+        'email': 'benchmark@example.com',
+        'body': 'Benchmark comment.',
+    }
+    return [
+        *((name, 'get', path, None) for name, path in pages),
+        # Last, every request adds a comment.
+        ('post_comment', 'post', reverse('blog:post_comment', args=[post.id]), comment),
+    ]
+
+
+class Benchmark:
+    def __init__(self, base_url, requests=20, warmup=1):
+        self.url = urlsplit(base_url)
+        self.requests = requests
+        self.warmup = warmup
+
+    def request(self, client, method, path, data):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(
+                path,
+                data,
+                secure=self.url.scheme == 'https'
+            )
+            elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise BenchmarkError(f'{method.upper()} {path} answered with {response.status_code}.')
+        return elapsed * 1000, len(queries), len(response.content)
+
+    def measure(self, method, path, data):
+        # The first request runs on an empty cache, the timed ones after the
+        # warmup requests show the steady state.
+        cache.clear()
+        client = Client(HTTP_HOST=self.url.netloc)
+        cold = self.request(client, method, path, data)
+        for i in range(self.warmup):
+            self.request(client, method, path, data)
+        timings, queries, sizes = zip(*(
+            self.request(client, method, path, data)
+            for i in range(self.requests)
+        ))
+        return {
+            'path': path,
+            'cold_ms': round(cold[0], 3),
+            'cold_queries': cold[1],
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'max_ms': round(max(timings), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    def run(self):
+        return {
+            name: self.measure(method, path, data)
+            for name, method, path, data in benchmark_routes()
+        }
+
+
+def compare_results(previous, current):
+    # One line per route with the change of the median latency, the query
+    # count and the response size.
+    lines = []
+    for name, result in current['routes'].items():
+        before = previous.get('routes', {}).get(name)
+        if before is None:
+            lines.append(f'{name}: new route')
+            continue
+        change = 0
+        if before['p50_ms']:
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        lines.append(
+            f'{name}: p50 {before["p50_ms"]:.3f} -> {result["p50_ms"]:.3f} ms ({change:+.1f}%), '
+            f'queries {before["queries"]} -> {result["queries"]}, '
+            f'bytes {before["bytes"]} -> {result["bytes"]}'
+        )
+    return lines
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def version_key(name):
+    return f'blog:version:{name}'
+
+
+def changed_key(name):
+    return f'blog:changed:{name}'
+
+
+def get_versions(*names):
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a version lost to eviction or a restart
+            # never matches values cached under an older one.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    for name in names:
+        key = version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    cache.set_many({changed_key(name): time.time() for name in names}, None)
+
+
+def last_changed(*names):
+    # Unix time of the latest bump of any of the versions, a lost entry
+    # counts as changed now.
+    keys = [changed_key(name) for name in names]
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, time.time(), None)
+            stamps[key] = cache.get(key)
+    return max(stamps.values())
+
+
+def page_version(path):
+    return f'page:{path}'
+
+
+def bump_pages(*paths):
+    bump_versions(*{page_version(path) for path in paths})
+
+
+def cached(name, versions, builder, timeout=None):
+    stamp = ':'.join(str(version) for version in get_versions(*versions))
+    key = f'blog:{name}:{stamp}'
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout or settings.BLOG_CACHE_TIMEOUT)
+    return value
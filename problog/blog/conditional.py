@@ -0,0 +1,168 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+from django.views.decorators.http import condition
+
+from blog.cache import get_versions, last_changed
+from blog.models import Post
+from blog.sitemaps import post_section, post_sections
+from frontend.templatetags.uitags import theme_stylesheet
+
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def request_state(request, state, *args, **kwargs):
+    # condition() asks for the ETag and the Last-Modified date separately,
+    # both come from a single lookup per request which views can reuse.
+    states = request.__dict__.setdefault('_blog_conditional', {})
+    if state not in states:
+        states[state] = state(request, *args, **kwargs)
+    return states[state]
+
+
+def conditional(state):
+    # A state of None skips the validators and lets the view answer, e.g.
+    # with a 404.
+    def current_state(request, *args, **kwargs):
+        return request_state(request, state, *args, **kwargs)
+
+    def etag(request, *args, **kwargs):
+        current = current_state(request, *args, **kwargs)
+        if current is not None:
+            parts, stamps = current
+            return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        current = current_state(request, *args, **kwargs)
+        if current is not None:
+            parts, stamps = current
+            return max(stamp for stamp in stamps if stamp is not None)
+
+    def decorator(view):
+        # Feeds send their own Last-Modified date, which condition() keeps.
+        # Drop it so clients revalidate against ours.
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def validated_async_view(request, *args, **kwargs):
+                response = await view(request, *args, **kwargs)
+                if response.has_header('Last-Modified'):
+                    del response['Last-Modified']
+                return response
+
+            conditional_view = condition(
+                etag_func=etag,
+                last_modified_func=last_modified
+            )(validated_async_view)
+
+            # The state is looked up off the event loop first, condition()
+            # then only reads it back from the request.
+            @wraps(view)
+            async def async_view(request, *args, **kwargs):
+                await sync_to_async(current_state)(request, *args, **kwargs)
+                return await conditional_view(request, *args, **kwargs)
+            return async_view
+
+        @wraps(view)
+        def validated_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.has_header('Last-Modified'):
+                del response['Last-Modified']
+            return response
+        return condition(
+            etag_func=etag,
+            last_modified_func=last_modified
+        )(validated_view)
+
+    return decorator
+
+
+def posts_state(queryset):
+    posts = queryset.order_by().aggregate(
+        updated=Max('updated'),
+        total=Count('id'),
+    )
+    return [posts['updated'], posts['total']], [posts['updated']]
+
+
+def page_state(request):
+    # Every page embeds the sidebar and the theme stylesheet. Pending flash
+    # messages are only shown by a full render.
+    if get_messages(request):
+        return None
+    versions = get_versions('posts', 'comments')
+    theme = theme_stylesheet.resolve()
+    stamps = [from_timestamp(last_changed('posts', 'comments'))]
+    if theme_stylesheet.mtime is not None:
+        stamps.append(from_timestamp(theme_stylesheet.mtime / 1e9))
+    return [versions, theme], stamps
+
+
+def combine(*states):
+    if None in states:
+        return None
+    parts, stamps = [], []
+    for state_parts, state_stamps in states:
+        parts.extend(state_parts)
+        stamps.extend(state_stamps)
+    return parts, stamps
+
+
+def post_list_state(request, tag_slug=None):
+    queryset = Post.published.all()
+    if tag_slug:
+        queryset = queryset.filter(tags__slug=tag_slug)
+    posts = posts_state(queryset)
+    if tag_slug and not posts[0][1]:
+        return None
+    return combine(posts, page_state(request))
+
+
+def post_detail_state(request, year, month, day, post):
+    active = Q(comments__active=True)
+    current = Post.published.filter(
+        publish__year=year,
+        publish__month=month,
+        publish__day=day,
+        slug=post
+    ).order_by().values('id', 'updated').annotate(
+        comments_updated=Max('comments__updated', filter=active),
+        comments_total=Count('comments', filter=active),
+    ).first()
+    if current is None:
+        return None
+    # The comment form carries a token tied to the CSRF cookie.
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return combine(
+        (
+            [*current.values(), csrf_cookie],
+            [current['updated'], current['comments_updated']],
+        ),
+        page_state(request),
+    )
+
+
+def sitemap_index_state(request):
+    sections = post_sections()
+    if not sections:
+        return None
+    return sections, [lastmod for section, lastmod, total in sections]
+
+
+def sitemap_section_state(request, section):
+    lastmod, total = post_section(section)
+    if not total:
+        return None
+    return [lastmod, total], [lastmod]
+
+
+post_list_condition = conditional(post_list_state)
+post_detail_condition = conditional(post_detail_state)
+sitemap_index_condition = conditional(sitemap_index_state)
+sitemap_section_condition = conditional(sitemap_section_state)
@@ -0,0 +1,281 @@
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db.models import Count, Max, Q
+from django.test import Client
+from django.urls import reverse
+from taggit.models import TaggedItem
+
+from blog.models import Post, SimilarPost
+from blog.pagecache import CSRF_INPUT, sidebar_digest
+from blog.rendering import markdown_version
+from frontend.templatetags.uitags import theme_stylesheet
+
+
+STATE_FILE = '.export-state.json'
+EXTENSIONS = {
+    'text/html': '.html',
+    'application/rss+xml': '.xml',
+    'application/xml': '.xml',
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_paths(path):
+    # The files nginx looks up for a path, see config/nginx: "?page=N" maps
+    # to page/N/ and the first page of a list is also its index.
+    url = urlsplit(path)
+    if url.query:
+        page = url.query.removeprefix('page=')
+        names = [f'page/{page}/index']
+        if page == '1':
+            names.append('index')
+        return [f'{url.path}{name}' for name in names]
+    if url.path.endswith('/'):
+        return [f'{url.path}index']
+    return [url.path]
+
+
+def write_page(root, path, response):
+    content_type = response['Content-Type'].split(';')[0]
+    content = response.content
+    if content_type == 'text/html':
+        # Static pages cannot carry a per-reader token, the comment form
+        # submits the CSRF cookie instead.
+        content = CSRF_INPUT.sub(
+            r'\g<1>\g<2>',
+            content.decode(response.charset)
+        ).encode(response.charset)
+    files = []
+    for name in export_paths(path):
+        if not Path(name).suffix:
+            name += EXTENSIONS.get(content_type, '.html')
+        file = Path(root, name.lstrip('/'))
+        file.parent.mkdir(parents=True, exist_ok=True)
+        temporary = file.with_name(f'.{file.name}.tmp')
+        temporary.write_bytes(content)
+        os.replace(temporary, file)
+        files.append(str(file.relative_to(root)))
+    return files
+
+
+def render_pages(root, base_url, paths):
+    url = urlsplit(base_url)
+    client = Client(HTTP_HOST=url.netloc)
+    pages = {}
+    for path in paths:
+        response = client.get(path, secure=url.scheme == 'https')
+        if response.status_code != 200:
+            raise ExportError(f'{path} answered with {response.status_code}.')
+        pages[path] = write_page(root, path, response)
+    return pages
+
+
+def list_paths(path, total):
+    # Keyset lists are exported as their first page only, the "?after=" and
+    # "?before=" pages it links to always reach Django, see config/nginx.
+    if settings.BLOG_PAGINATION == 'keyset':
+        return [path]
+    pages = max(1, math.ceil(total / settings.BLOG_POSTS_PER_PAGE))
+    return [f'{path}?page={page}' for page in range(1, pages + 1)]
+
+
+def sitemap_paths(post_ids):
+    size = settings.BLOG_SITEMAP_SECTION_SIZE
+    return [
+        reverse('sitemap'),
+        *(
+            reverse('sitemap_section', args=[section])
+            for section in sorted({int(post_id) // size for post_id in post_ids})
+        ),
+    ]
+
+
+def site_state(base_url):
+    # Every page embeds these, any change needs a full export.
+    return [
+        base_url,
+        markdown_version(),
+        theme_stylesheet.resolve(),
+        sidebar_digest(),
+        settings.BLOG_POSTS_PER_PAGE,
+        settings.BLOG_PAGINATION,
+    ]
+
+
+def posts_state():
+    active = Q(comments__active=True)
+    posts = {}
+    for post in Post.published.order_by().only('slug', 'publish', 'updated').annotate(
+        comments_updated=Max('comments__updated', filter=active),
+        comments_total=Count('comments', filter=active),
+    ):
+        posts[str(post.pk)] = {
+            'url': post.get_absolute_url(),
+            'stamp': [
+                str(post.updated),
+                str(post.comments_updated),
+                post.comments_total,
+            ],
+            'tags': [],
+            'similar': [],
+        }
+    for post_id, slug in TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id__in=Post.published.values('id')
+    ).values_list('object_id', 'tag__slug').order_by('tag__slug'):
+        posts[str(post_id)]['tags'].append(slug)
+    for post_id, similar_id in SimilarPost.objects.filter(
+        post__status=Post.Status.PUBLISHED,
+        similar__status=Post.Status.PUBLISHED
+    ).values_list('post_id', 'similar_id'):
+        posts[str(post_id)]['similar'].append(similar_id)
+    return posts
+
+
+class Exporter:
+    def __init__(self, root, base_url, jobs=1):
+        self.root = Path(root)
+        self.base_url = base_url
+        self.jobs = jobs
+        self.state_file = self.root / STATE_FILE
+
+    def load_state(self):
+        try:
+            return json.loads(self.state_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def save_state(self, state):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temporary = self.state_file.with_name(f'{STATE_FILE}.tmp')
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, self.state_file)
+
+    def all_paths(self, posts):
+        tags = {}
+        for post in posts.values():
+            for slug in post['tags']:
+                tags[slug] = tags.get(slug, 0) + 1
+        return [
+            *(post['url'] for post in posts.values()),
+            *list_paths(reverse('blog:post_list'), len(posts)),
+            *(
+                path
+                for slug, total in sorted(tags.items())
+                for path in [
+                    *list_paths(
+                        reverse('blog:post_list_by_tag', args=[slug]),
+                        total
+                    ),
+                    reverse('blog:post_feed_by_tag', args=[slug]),
+                ]
+            ),
+            reverse('blog:post_feed'),
+            *sitemap_paths(posts),
+        ]
+
+    def changed_paths(self, previous, posts):
+        before = previous['posts']
+        changed = {
+            post_id
+            for post_id, post in posts.items()
+            if before.get(post_id) != post
+        }
+        removed = set(before) - set(posts)
+        if not changed and not removed:
+            return []
+        touched = {int(post_id) for post_id in changed | removed}
+        details = {
+            post['url']
+            for post_id, post in posts.items()
+            if post_id in changed or touched.intersection(post['similar'])
+        }
+        tags = {
+            slug
+            for post_id in changed | removed
+            for post in (before.get(post_id), posts.get(post_id))
+            if post
+            for slug in post['tags']
+        }
+        tag_paths = []
+        for slug in sorted(tags):
+            total = sum(slug in post['tags'] for post in posts.values())
+            if total:
+                tag_paths.extend(list_paths(
+                    reverse('blog:post_list_by_tag', args=[slug]),
+                    total
+                ))
+                tag_paths.append(reverse('blog:post_feed_by_tag', args=[slug]))
+        sitemaps = sitemap_paths(posts)
+        return [
+            *sorted(details),
+            *list_paths(reverse('blog:post_list'), len(posts)),
+            *tag_paths,
+            reverse('blog:post_feed'),
+            *(
+                path
+                for path in sitemap_paths(changed | removed)
+                if path in sitemaps
+            ),
+        ]
+
+    def render(self, paths):
+        render = partial(render_pages, self.root, self.base_url)
+        if self.jobs > 1 and len(paths) > 1:
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            chunks = [paths[i::self.jobs * 4] for i in range(self.jobs * 4)]
+            pages = {}
+            with ProcessPoolExecutor(self.jobs, initializer=django.setup) as pool:
+                for rendered in pool.map(render, chunks):
+                    pages.update(rendered)
+            return pages
+        return render(paths)
+
+    def export(self, full=False):
+        previous = self.load_state()
+        site = site_state(self.base_url)
+        posts = posts_state()
+        full = full or previous is None or previous['site'] != site
+        if full:
+            paths = self.all_paths(posts)
+            pages = self.render(paths)
+        else:
+            paths = self.changed_paths(previous, posts)
+            # Drops removed posts, emptied tags and list pages past the end.
+            current = set(self.all_paths(posts))
+            pages = {
+                path: files
+                for path, files in previous['pages'].items()
+                if path in current
+            }
+            pages.update(self.render(paths))
+        files = {file for files in pages.values() for file in files}
+        stale = set()
+        if previous:
+            stale = {
+                file
+                for files in previous['pages'].values()
+                for file in files
+            } - files
+        for file in stale:
+            Path(self.root, file).unlink(missing_ok=True)
+        self.save_state({
+            'site': site,
+            'posts': posts,
+            'pages': pages,
+        })
+        return paths, sorted(stale)
@@ -1,25 +1,89 @@
-import markdown
+import hashlib
+
 from django.contrib.syndication.views import Feed
-from django.template.defaultfilters import truncatewords_html
-from django.urls import reverse_lazy
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from taggit.models import Tag
 
+from blog.cache import cached, last_changed
+from blog.conditional import conditional, from_timestamp, request_state
 from blog.models import Post
 
 
+FEED_SIZE = 5
+
+
+def feed_posts(tag_slug=None):
+    posts = Post.published.all()
+    if tag_slug:
+        posts = posts.filter(tags__slug=tag_slug)
+    return posts
+
+
+def feed_state(request, tag_slug=None):
+    # The feed's posts and their update times, tag changes touch the posts
+    # too. The version bump covers deleted posts.
+    rows = list(feed_posts(tag_slug).values_list('id', 'updated')[:FEED_SIZE])
+    if not rows:
+        return None
+    stamps = [updated for post_id, updated in rows]
+    return rows, [*stamps, from_timestamp(last_changed('posts'))]
+
+
+feed_condition = conditional(feed_state)
+
+
 class LatestPostsFeed(Feed):
     title = 'No Outlet - Official Blog'
     link = reverse_lazy('blog:post_list')
     description = 'Most recent publications at The Official No Outlet band Blog'
 
-    def items(self):
-        return Post.published.all()[:5]
+    def __call__(self, request, *args, **kwargs):
+        current = request_state(request, feed_state, *args, **kwargs)
+        if current is None:
+            return super().__call__(request, *args, **kwargs)
+        rows, stamps = current
+        digest = hashlib.sha1(
+            repr([request.build_absolute_uri(), rows]).encode()
+        ).hexdigest()
+        content, content_type = cached(
+            f'feed:{digest}',
+            [],
+            lambda: self.render(request, *args, **kwargs)
+        )
+        return HttpResponse(content, content_type=content_type)
+
+    def render(self, request, *args, **kwargs):
+        response = super().__call__(request, *args, **kwargs)
+        return response.content, response['Content-Type']
+
+    def items(self, obj=None):
+        tag_slug = obj.slug if obj else None
+        return feed_posts(tag_slug).for_listing()[:FEED_SIZE]
     
     def item_title(self, item):
         return item.title
     
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
     def item_pubdate(self, item):
         return item.publish
     
     def item_description(self, item):
-        return truncatewords_html(markdown.markdown(item.body), 30)
-    
\ No newline at end of file
+        return item.get_excerpt_html()
+
+
+class TagPostsFeed(LatestPostsFeed):
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def title(self, obj):
+        return f'{LatestPostsFeed.title} - {obj.name}'
+
+    def link(self, obj):
+        return reverse('blog:post_list_by_tag', args=[obj.slug])
+
+    def description(self, obj):
+        return f'Most recent publications tagged "{obj.name}" at The Official No Outlet band Blog'
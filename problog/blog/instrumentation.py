@@ -0,0 +1,168 @@
+import heapq
+import math
+import statistics
+import time
+from collections import defaultdict, deque
+from threading import Lock, get_ident
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+from problog.timing import current_timings, timed, timer
+
+
+# Reported in the Server-Timing header and on the stats page, in this order.
+METRICS = ('sql', 'template', 'sidebar', 'forms', 'markdown')
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class RequestTimings:
+    # Filled in while a request is handled. Async views may query from
+    # several threads at once, hence the lock.
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.durations = defaultdict(float)
+        self.slowest = []
+        self._depth = defaultdict(int)
+        self._lock = Lock()
+
+    def enter(self, name):
+        # Spans of the same name only nest within a thread, the spans of
+        # threads running side by side are all added.
+        with self._lock:
+            self._depth[get_ident(), name] += 1
+        return time.perf_counter()
+
+    def exit(self, name, start):
+        duration = time.perf_counter() - start
+        key = (get_ident(), name)
+        with self._lock:
+            self._depth[key] -= 1
+            if not self._depth[key]:
+                del self._depth[key]
+                self.durations[name] += duration
+
+    def add_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.durations['sql'] += duration
+            entry = (duration, self.queries, sql[:500])
+            if len(self.slowest) < settings.BLOG_INSTRUMENTATION_SLOW_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def slowest_queries(self):
+        return [(duration, sql) for duration, i, sql in sorted(self.slowest, reverse=True)]
+
+    def header(self):
+        metrics = [
+            f'{name};dur={self.durations[name] * 1000:.1f}'
+            for name in METRICS
+            if name in self.durations
+        ]
+        metrics.insert(0, f'queries;desc="{self.queries} queries"')
+        metrics.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - start)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timer('template'):
+            return self.template.render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ViewStats:
+    # Rolling window of the latest requests per view, kept in each process.
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = Lock()
+        self._samples = {}
+        self._totals = defaultdict(int)
+
+    def add(self, view_name, timings):
+        sample = (
+            timings.total,
+            timings.queries,
+            dict(timings.durations),
+            timings.slowest_queries(),
+        )
+        with self._lock:
+            if view_name not in self._samples:
+                self._samples[view_name] = deque(maxlen=self.window)
+            self._samples[view_name].append(sample)
+            self._totals[view_name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+    def summary(self):
+        with self._lock:
+            samples = {name: list(rows) for name, rows in self._samples.items()}
+            totals = dict(self._totals)
+        views = []
+        for name, rows in samples.items():
+            durations = [total * 1000 for total, *rest in rows]
+            slowest = heapq.nlargest(
+                settings.BLOG_INSTRUMENTATION_SLOW_QUERIES,
+                {query for *rest, queries in rows for query in queries}
+            )
+            views.append({
+                'name': name,
+                'requests': totals[name],
+                'samples': len(rows),
+                'mean_ms': statistics.fmean(durations),
+                'p95_ms': percentile(durations, 95),
+                'max_ms': max(durations),
+                'queries': statistics.fmean(queries for total, queries, *rest in rows),
+                'metrics': [
+                    (metric, statistics.fmean(
+                        metrics.get(metric, 0) * 1000
+                        for total, queries, metrics, slow in rows
+                    ))
+                    for metric in METRICS
+                ],
+                'slowest': [(duration * 1000, sql) for duration, sql in slowest],
+            })
+        return sorted(views, key=lambda view: view['mean_ms'] * view['samples'], reverse=True)
+
+
+view_stats = ViewStats(settings.BLOG_INSTRUMENTATION_WINDOW)
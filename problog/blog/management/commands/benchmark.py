@@ -0,0 +1,87 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from blog.benchmark import Benchmark, BenchmarkError, compare_results
+from blog.seed import seed_blog
+
+
+# Keeps the cache of the configured backend, which may be shared with a
+# running site, out of the measurements.
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = '''Measures every route of the blog and the sitemap against a freshly migrated test database on the configured server, SQLite locally or the docker-compose Postgres with problog.settings.prod, seeded like "seed_blog". Each route gets one request on an empty cache, --warmup untimed requests and --requests timed ones, all through the host of --url. Requests go through Django's in-process test client with a private local-memory cache, so the numbers are the cost of the views and their queries, not the throughput of a running server: no uWSGI or ASGI workers, nginx, network or shared cache are involved, use a load generator against the deployment for those. The latency percentiles, query counts and response sizes are written as JSON to --output (stdout by default) so runs can be diffed between commits, --compare prints the differences from the JSON of an earlier run.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', dest='posts', type=int, default=2000)
+        parser.add_argument('--tags', dest='tags', type=int, default=50)
+        parser.add_argument('--comments', dest='comments', type=int, default=10)
+        parser.add_argument('--seed', dest='seed', type=int, default=0)
+        parser.add_argument('--requests', dest='requests', type=int, default=20)
+        parser.add_argument('--warmup', dest='warmup', type=int, default=2)
+        parser.add_argument('--url', dest='url', type=str, default=settings.BLOG_EXPORT_URL)
+        parser.add_argument('--output', dest='output', type=str, default='-')
+        parser.add_argument('--compare', dest='compare', type=str, required=False)
+
+    def handle(self, *args, **options):
+        output = options.get('output', '-')
+        previous = None
+        if options.get('compare'):
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    previous = json.load(file)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'\n\n{"-"*48}\nERROR: Could not read the results to compare with, {error}')
+                return
+        benchmark = Benchmark(
+            options.get('url'),
+            requests=options.get('requests'),
+            warmup=options.get('warmup')
+        )
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            databases = setup_databases(
+                verbosity=0,
+                interactive=False,
+                serialized_aliases=set()
+            )
+            try:
+                seeded = seed_blog(
+                    posts=options.get('posts'),
+                    tags=options.get('tags'),
+                    comments=options.get('comments'),
+                    seed=options.get('seed'),
+                )
+                routes = benchmark.run()
+            except BenchmarkError as error:
+                self.stderr.write(f'\n\n{"-"*48}\nERROR: {error}')
+                return
+            finally:
+                teardown_databases(databases, verbosity=0)
+        results = {
+            'database': connection.vendor,
+            'seed': {'seed': options.get('seed'), **seeded},
+            'requests': benchmark.requests,
+            'warmup': benchmark.warmup,
+            'routes': routes,
+        }
+        content = json.dumps(results, indent=2, sort_keys=True) + '\n'
+        if output == '-':
+            self.stdout.write(content, ending='')
+            summary = self.stderr
+        else:
+            with open(output, 'w', encoding='utf-8') as file:
+                file.write(content)
+            summary = self.stdout
+        if previous is not None:
+            summary.write('\n'.join(compare_results(previous, results)))
+        summary.write(f'\n\n{"-"*48}\nSUCCESS: Measured {len(routes)} routes on {connection.vendor} with {seeded["posts"]} posts, results written to "{output}".')
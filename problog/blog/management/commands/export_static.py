@@ -0,0 +1,61 @@
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.cache import last_changed
+from blog.export import ExportError, Exporter
+
+
+class Command(BaseCommand):
+    help = '''Renders every published post, the paginated post and tag lists, the RSS feed and the sitemap to static files under "BLOG_EXPORT_ROOT" (or --output) for nginx to serve without reaching Django. Runs are incremental, only the pages showing posts, comments or tags that changed since the last run are rendered again, while a change to the sidebar, theme, Markdown version or page size renders everything. Use --full to force a full export, e.g. after deploying template changes, and --jobs to render a full export with several worker processes. With "BLOG_PAGINATION" set to "keyset" only the first page of each list is exported, its cursor links are served by Django. Use --watch to keep the export current: it polls the shared cache every --interval seconds and exports as soon as a post or comment changed, and at least every "BLOG_EXPORT_MAX_INTERVAL" seconds for changes that do not bump the cache, e.g. tag renames. The "exporter" service of docker-compose.yml runs it.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', dest='output', type=str, default=settings.BLOG_EXPORT_ROOT)
+        parser.add_argument('--url', dest='url', type=str, default=settings.BLOG_EXPORT_URL)
+        parser.add_argument('--full', dest='full', action='store_true')
+        parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--watch', dest='watch', action='store_true')
+        parser.add_argument('--interval', dest='interval', type=float, default=settings.BLOG_EXPORT_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        exporter = Exporter(
+            options.get('output'),
+            options.get('url'),
+            jobs=options.get('jobs', 1)
+        )
+        if not options.get('watch', False):
+            self.export(exporter, full=options.get('full', False))
+            return
+        interval = options.get('interval')
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        full = options.get('full', False)
+        exported_at = changed = None
+        try:
+            while self.running:
+                current = last_changed('posts', 'comments')
+                if (
+                    current != changed
+                    or time.monotonic() - exported_at >= settings.BLOG_EXPORT_MAX_INTERVAL
+                ):
+                    self.export(exporter, full=full)
+                    full = False
+                    exported_at = time.monotonic()
+                    changed = current
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def export(self, exporter, full=False):
+        try:
+            paths, removed = exporter.export(full=full)
+        except ExportError as error:
+            self.stderr.write(f'\n\n{"-"*48}\nERROR: {error} Nothing was recorded, the next run starts over from the previous export.')
+            return
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Exported {len(paths)} pages and removed {len(removed)} stale files in "{exporter.root}".')
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -1,62 +1,84 @@
+import csv
 import datetime
+import json
 
-from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.core.mail import send_mass_mail
-from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db import connections
+from django.db.models import Max
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 from blog.models import Post, Comment
 
 
 class Command(BaseCommand):
+    help = '''Exports the name and email address of everyone who left an active comment, one row per email address (compared case-insensitively) with the name from their latest comment. Rows are deduplicated by the database and streamed, so the export runs in constant memory. Only active comments are read unless --all is given, which includes the hidden ones. Use --for-post and --weeks-since to narrow the comments, --format to write "csv" (default) or "jsonl", and --output to write to a file instead of stdout.'''
 
     def add_arguments(self, parser):
         parser.add_argument('--all', dest='is_all', action='store_true')
         parser.add_argument('--weeks-since', dest='since', type=int, required=False)
         parser.add_argument('--for-post', dest='post_id', type=int, required=False)
-    
+        parser.add_argument('--format', dest='format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', dest='output', type=str, default='-')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=2000)
+
     def handle(self, *args, **options):
         is_all = options.get('is_all', False)
         weeks = options.get('since', None)
         post_id = options.get('post_id', None)
-        post = None
+        output = options.get('output', '-')
+        if post_id and not Post.objects.filter(id=post_id).exists():
+            self.stderr.write(f'\n\n{"-"*48}\nERROR: Post ID #{post_id} does not refer to any post in the database.')
+            return
+        comments = Comment.objects.all()
+        if not is_all:
+            comments = comments.filter(active=True)
         if post_id:
-            try:
-                post = Post.objects.get(
-                    id=post_id
-                )
-            except Post.DoesNotExist:
-                self.stderr.write(f'Post ID #{post_id} does not refer to any post in the database.')
-                return False
-        comments = Comment.objects.filter(active=True)
-        if post:
-            comments = comments.filter(post=post)
+            comments = comments.filter(post_id=post_id)
         if weeks:
-            date_added = timezone.now().today() - datetime.timedelta(days=7 * weeks)
             comments = comments.filter(
-                created__date__gte=date_added
+                created__gte=timezone.now() - datetime.timedelta(weeks=weeks)
             )
-        if comments:
-            duplicates = 0
-            emails = []
-            for comment in comments:
-                data = (comment.name, comment.email)
-                if data[1] in emails:
-                    duplicates += 1
-                    continue
-                emails.append(data)
-            self.stdout.write(f'Arranged personal data from comments meeting your criteria into list. Found {len(emails)} unique leads, not counting the {duplicates} duplicate records that were discarded.')
-            self.stdout.write('\n\n\n')
-            self.stdout.write(f'Lead Info from Blog Comments\n{"-"*25}\n\n')
-            for email in emails:
-                self.stdout.write(f'|{email[0].title()}| - {email[1]}\n{"-"*25}')
-            self.stdout.write(f'\n\nFinished. Aborting...')
-            return True
+        total = comments.count()
+        if not total:
+            self.stderr.write(f'\n\n{"-"*48}\nERROR: Your criteria for post comments did not return any data, please broaden your criteria before trying again.')
+            return
+        if output == '-':
+            exported = self.export(self.leads(comments), self.stdout, options)
+            summary = self.stderr
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as file:
+                exported = self.export(self.leads(comments), file, options)
+            summary = self.stdout
+        summary.write(f'\n\n{"-"*48}\nSUCCESS: Exported {exported} unique leads to "{output}", not counting the {total - exported} duplicate records that were discarded.')
 
+    def leads(self, comments):
+        comments = comments.annotate(email_key=Lower('email'))
+        if connections[comments.db].vendor == 'postgresql':
+            # DISTINCT ON keeps the first row of each email, the latest one.
+            latest = comments.order_by('email_key', '-created', '-id').distinct('email_key')
         else:
-            self.stdout.write(f'Your criteria for post comments did not return any data, please broaden your criteria before trying again.')
-            return False
+            # One GROUP BY over the emails, ids grow with the creation time.
+            latest_ids = comments.order_by().values('email_key').annotate(
+                latest=Max('id')
+            ).values('latest')
+            latest = Comment.objects.filter(pk__in=latest_ids).annotate(
+                email_key=Lower('email')
+            ).order_by('email_key')
+        return latest.values_list('name', 'email')
 
-            
\ No newline at end of file
+    def export(self, leads, file, options):
+        chunk_size = options.get('chunk_size', 2000)
+        if options.get('format') == 'jsonl':
+            write = lambda name, email: file.write(
+                json.dumps({'name': name, 'email': email}) + '\n'
+            )
+        else:
+            writer = csv.writer(file)
+            writer.writerow(['name', 'email'])
+            write = lambda name, email: writer.writerow([name, email])
+        exported = 0
+        for name, email in leads.iterator(chunk_size=chunk_size):
+            write(name, email)
+            exported += 1
+        return exported
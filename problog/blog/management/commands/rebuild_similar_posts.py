@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.similar import rebuild_similar_posts
+
+
+class Command(BaseCommand):
+    help = '''Rebuilds the precomputed "similar posts" table from scratch, ranking the posts that share the most tags with each published post (ties go to the most recently published post). Saving a post or changing its tags keeps the table up to date incrementally, run this after importing data or changing the BLOG_SIMILAR_POSTS setting.'''
+
+    def handle(self, *args, **options):
+        total = rebuild_similar_posts()
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Rebuilt the similar posts table with {total} entries.')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from blog.cache import bump_versions
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = '''Recomputes the stored active comment counter of every post (or only the post given with --for-post) from the comments table in a single bulk UPDATE. Use this to repair the counters after comments were changed outside of the ORM, e.g. with raw SQL or a database restore.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--for-post', dest='post_id', type=int, required=False)
+
+    def handle(self, *args, **options):
+        post_id = options.get('post_id', None)
+        posts = Post.objects.all()
+        if post_id:
+            posts = posts.filter(id=post_id)
+        updated = posts.recount_comments()
+        bump_versions('comments')
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Recounted the active comments of {updated} posts.')
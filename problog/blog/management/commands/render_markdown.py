@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.rendering import markdown_version
+
+
+class Command(BaseCommand):
+    help = '''Re-renders the stored HTML, excerpt and word count of every post whose body was rendered with a different Markdown version, extension set or excerpt length than the one currently configured in "BLOG_MARKDOWN_EXTENSIONS". Run this after changing the Markdown extensions or upgrading the Markdown package. Use --all to re-render every post regardless of its stored render version.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', dest='is_all', action='store_true')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        is_all = options.get('is_all', False)
+        batch_size = options.get('batch_size', 500)
+        version = markdown_version()
+        posts = Post.objects.all()
+        if not is_all:
+            posts = posts.exclude(body_html_version=version)
+        posts = posts.only('id', 'body').order_by('id')
+        batch = []
+        total = 0
+        for post in posts.iterator(chunk_size=batch_size):
+            # Written with bulk_update() rather than save(), which would send
+            # post_save and bump the caches once per post.
+            post.render_body()
+            batch.append(post)
+            if len(batch) >= batch_size:
+                Post.objects.bulk_update(batch, Post.RENDERED_FIELDS)
+                total += len(batch)
+                batch = []
+        if batch:
+            Post.objects.bulk_update(batch, Post.RENDERED_FIELDS)
+            total += len(batch)
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Rendered the Markdown body of {total} posts with render version "{version}".')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.seed import SEED_AUTHOR, clear_seed, seed_blog
+
+
+class Command(BaseCommand):
+    help = '''Fills the database with synthetic posts, tags and comments for load testing and benchmarks. Rows are written in bulk, so thousands of posts take seconds, and the same --seed always produces the same posts and URLs. Seeded rows belong to the "seed" user, use --clear to remove them before seeding again, or with --posts 0 to only remove them.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', dest='posts', type=int, default=2000)
+        parser.add_argument('--tags', dest='tags', type=int, default=50)
+        parser.add_argument('--comments', dest='comments', type=int, default=10, help='Average number of comments per post.')
+        parser.add_argument('--seed', dest='seed', type=int, default=0)
+        parser.add_argument('--clear', dest='clear', action='store_true')
+
+    def handle(self, *args, **options):
+        if options.get('clear', False):
+            removed = clear_seed()
+            self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Removed {removed} seeded posts.')
+        elif Post.objects.filter(author__username=SEED_AUTHOR).exists():
+            self.stderr.write(f'\n\n{"-"*48}\nERROR: The database already holds seeded posts, use --clear to replace them.')
+            return
+        if not options.get('posts'):
+            return
+        seeded = seed_blog(
+            posts=options.get('posts'),
+            tags=options.get('tags'),
+            comments=options.get('comments'),
+            seed=options.get('seed'),
+        )
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Seeded {seeded["posts"]} posts, {seeded["tags"]} tags and {seeded["comments"]} comments.')
@@ -0,0 +1,44 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.outbox import Outbox
+
+
+class Command(BaseCommand):
+    help = '''Runs the email outbox worker, which sends the queued share emails in batches over a single reused SMTP connection. Messages that fail are retried with an exponential backoff ("BLOG_OUTBOX_RETRY_DELAY") and given up after "BLOG_OUTBOX_MAX_ATTEMPTS" attempts. Each batch is leased to the worker for "BLOG_OUTBOX_LEASE" seconds, other workers skip it, and every message is marked as sent as soon as it was delivered. The worker polls the outbox every --interval seconds until it is stopped, use --once to drain the messages that are due and exit.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', dest='once', action='store_true')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=settings.BLOG_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', dest='interval', type=float, default=settings.BLOG_OUTBOX_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        once = options.get('once', False)
+        interval = options.get('interval')
+        outbox = Outbox(batch_size=options.get('batch_size'))
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        total_sent = total_failed = 0
+        try:
+            while self.running:
+                sent, failed = outbox.send_batch()
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    continue
+                if once:
+                    break
+                # Nothing is due, do not hold an idle SMTP connection while waiting.
+                outbox.close()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            outbox.close()
+        self.stdout.write(f'\n\n{"-"*48}\nSUCCESS: Sent {total_sent} emails, {total_failed} failed attempts will be retried or were given up.')
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -1,25 +1,184 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotFound, HttpResponsePermanentRedirect
 from django.urls import reverse
-from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import sync_and_async_middleware
 from taggit.models import Tag
 
-from blog.models import Post
+from blog.instrumentation import RequestTimings, current_timings, view_stats
+from blog.routers import choose_replica, current_replica, pin_primary
+
+
+class TagSlugCache:
+    # Keeps every tag slug in memory so subdomain lookups never hit the
+    # database. Above ``max_size`` tags it degrades to a bounded LRU of
+    # lookups, misses included.
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._slugs = None
+        self._loaded_at = None
+        self._lookups = OrderedDict()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._slugs = None
+            self._lookups.clear()
+
+    def __contains__(self, slug):
+        slugs = self._snapshot()
+        if slugs is not None:
+            return slug in slugs
+        with self._lock:
+            if slug in self._lookups:
+                self._lookups.move_to_end(slug)
+                return self._lookups[slug]
+        exists = Tag.objects.filter(slug=slug).exists()
+        with self._lock:
+            self._lookups[slug] = exists
+            while len(self._lookups) > self.max_size:
+                self._lookups.popitem(last=False)
+        return exists
+
+    def _snapshot(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or monotonic() - loaded_at > self.ttl:
+            slugs = list(
+                Tag.objects.order_by().values_list('slug', flat=True)[:self.max_size + 1]
+            )
+            with self._lock:
+                self._slugs = frozenset(slugs) if len(slugs) <= self.max_size else None
+                self._loaded_at = monotonic()
+                self._lookups.clear()
+        return self._slugs
 
 
+tag_slugs = TagSlugCache(
+    settings.BLOG_TAG_SLUG_CACHE_SIZE,
+    settings.BLOG_TAG_SLUG_CACHE_TTL
+)
+
+
+def tag_subdomain_response(request, host_parts):
+    slug = host_parts[0]
+    if slug in tag_slugs:
+        tag_url = reverse(
+            'blog:post_list_by_tag',
+            args=[slug]
+        )
+        url = '{}://{}{}'.format(
+            request.scheme,
+            '.'.join(host_parts[1:]),
+            tag_url
+        )
+        response = HttpResponsePermanentRedirect(url)
+        max_age = settings.BLOG_SUBDOMAIN_REDIRECT_MAX_AGE
+    else:
+        response = HttpResponseNotFound()
+        max_age = settings.BLOG_TAG_SLUG_CACHE_TTL
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def tag_subdomain(request):
+    host_parts = request.get_host().split('.')
+    if len(host_parts) > 2 and host_parts[0] != 'www':
+        return host_parts
+
+
+@sync_and_async_middleware
 def subdomain_blog_tags_middleware(get_response):
+    # Async under ASGI, so async views are not run in a thread. The slug
+    # lookup may query, it runs in one.
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            host_parts = tag_subdomain(request)
+            if host_parts:
+                return await sync_to_async(tag_subdomain_response)(
+                    request,
+                    host_parts
+                )
+            return await get_response(request)
+        return middleware
+
     def middleware(request):
-        host_parts = request.get_host().split('.')
-        if len(host_parts) > 2 and host_parts[0] != 'www':
-            tag = get_object_or_404(Tag, slug=host_parts[0])
-            tag_url = reverse(
-                'blog:post_list_by_tag',
-                args=[tag.slug]
-            )
-            url = '{}://{}{}'.format(
-                request.scheme,
-                '.'.join(host_parts[1:]),
-                tag_url
-            )
-            return redirect(url)
+        host_parts = tag_subdomain(request)
+        if host_parts:
+            return tag_subdomain_response(request, host_parts)
         response = get_response(request)
         return response
     return middleware
+
+
+def record_timings(request, response, timings):
+    timings.finish()
+    match = request.resolver_match
+    view_stats.add(match.view_name if match else 'unresolved', timings)
+    # Only sessions can belong to staff, anonymous readers never load one
+    # here.
+    if (
+        settings.SESSION_COOKIE_NAME in request.COOKIES
+        and getattr(request, 'user', None) is not None
+        and request.user.is_staff
+    ):
+        response['Server-Timing'] = timings.header()
+    return response
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.BLOG_INSTRUMENTATION:
+                return await get_response(request)
+            timings = RequestTimings()
+            token = current_timings.set(timings)
+            try:
+                response = await get_response(request)
+            finally:
+                current_timings.reset(token)
+            return await sync_to_async(record_timings)(request, response, timings)
+        return middleware
+
+    def middleware(request):
+        if not settings.BLOG_INSTRUMENTATION:
+            return get_response(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = get_response(request)
+        finally:
+            current_timings.reset(token)
+        return record_timings(request, response, timings)
+    return middleware
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    # Picks the read replica of the request, if any, for blog.routers.
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_replica.set(await sync_to_async(choose_replica)(request))
+            try:
+                response = await get_response(request)
+            finally:
+                current_replica.reset(token)
+            return pin_primary(request, response)
+        return middleware
+
+    def middleware(request):
+        token = current_replica.set(choose_replica(request))
+        try:
+            response = get_response(request)
+        finally:
+            current_replica.reset(token)
+        return pin_primary(request, response)
+    return middleware
@@ -0,0 +1,94 @@
+from django.db import migrations
+
+
+# A copy of the statements in blog.search as they were when this migration
+# was written, it must not change with that module.
+POSTGRES_INSTALL = [
+    'ALTER TABLE blog_post ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE INDEX IF NOT EXISTS blog_post_search_vector_idx ON blog_post USING gin (search_vector)',
+    '''
+    CREATE OR REPLACE FUNCTION blog_post_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector(coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector(coalesce(NEW.body, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS blog_post_search_vector_update ON blog_post',
+    '''
+    CREATE TRIGGER blog_post_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, body ON blog_post
+    FOR EACH ROW EXECUTE FUNCTION blog_post_search_vector_update()
+    ''',
+    '''
+    UPDATE blog_post SET search_vector =
+        setweight(to_tsvector(coalesce(blog_post.title, '')), 'A') ||
+        setweight(to_tsvector(coalesce(blog_post.body, '')), 'B')
+    WHERE search_vector IS NULL
+    ''',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS blog_post_search_vector_update ON blog_post',
+    'DROP FUNCTION IF EXISTS blog_post_search_vector_update()',
+    'ALTER TABLE blog_post DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_INSTALL = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5(
+        title, body, content='blog_post', content_rowid='id'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS blog_post_fts_insert AFTER INSERT ON blog_post BEGIN
+        INSERT INTO blog_post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS blog_post_fts_delete AFTER DELETE ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS blog_post_fts_update AFTER UPDATE OF title, body ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO blog_post_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    ''',
+    "INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS blog_post_fts_insert',
+    'DROP TRIGGER IF EXISTS blog_post_fts_delete',
+    'DROP TRIGGER IF EXISTS blog_post_fts_update',
+    'DROP TABLE IF EXISTS blog_post_fts',
+]
+
+
+def run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            cursor.execute(statement)
+
+
+def install(apps, schema_editor):
+    run(schema_editor, {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL})
+
+
+def uninstall(apps, schema_editor):
+    run(schema_editor, {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_post_active_comment_count_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'active', 'created'], name='blog_commen_post_id_6ee5ee_idx'),
+        ),
+    ]
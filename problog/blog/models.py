@@ -1,11 +1,51 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
 from taggit.managers import TaggableManager
 
+from blog.cache import bump_pages, bump_versions
+from blog.rendering import (
+    count_words,
+    markdown_version,
+    render_excerpt,
+    render_markdown,
+)
 
-class PublishedManager(models.Manager):
+
+LISTING_FIELDS = (
+    'title',
+    'slug',
+    'author',
+    'publish',
+    'body_html_version',
+    'excerpt_html',
+    'word_count',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        return self.select_related('author').only(
+            *LISTING_FIELDS,
+            'author__username',
+        ).prefetch_related('tags')
+
+    def recount_comments(self):
+        active_comments = Comment.objects.filter(
+            post=OuterRef('pk'),
+            active=True
+        ).order_by().values('post').annotate(
+            total=Count('pk')
+        ).values('total')
+        return self.update(
+            active_comment_count=Coalesce(Subquery(active_comments), 0)
+        )
+
+
+class PublishedManager(models.Manager.from_queryset(PostQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(
             status=Post.Status.PUBLISHED
@@ -24,6 +64,18 @@ class Post(models.Model):
         on_delete=models.CASCADE
     )
     body = models.TextField()
+    body_html = models.TextField(blank=True, editable=False)
+    body_html_version = models.CharField(
+        max_length=12,
+        blank=True,
+        editable=False
+    )
+    excerpt_html = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    active_comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False
+    )
     publish = models.DateTimeField(default=timezone.now)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -32,17 +84,65 @@ class Post(models.Model):
         choices=Status.choices,
         default=Status.DRAFT
     )
-    objects = models.Manager()
+    objects = PostQuerySet.as_manager()
     published = PublishedManager()
     tags = TaggableManager()
     class Meta:
         ordering = ['-publish']
         indexes = [
             models.Index(fields=['-publish']),
+            models.Index(fields=['status', '-active_comment_count', '-publish']),
+            models.Index(fields=['status', 'updated']),
         ]
 
+    COUNTER_FIELDS = ('active_comment_count',)
+    # Derived from the body by render_body().
+    RENDERED_FIELDS = ('body_html', 'body_html_version', 'excerpt_html', 'word_count')
+
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.render_body()
+            if not self._state.adding:
+                # Counters are maintained with atomic UPDATE statements, never
+                # write back the copy that was loaded with this instance.
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                    and field.name not in self.COUNTER_FIELDS
+                ]
+        elif 'body' in update_fields:
+            self.render_body()
+            kwargs['update_fields'] = {*update_fields, *self.RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+
+    def render_body(self):
+        self.body_html = render_markdown(self.body)
+        self.body_html_version = markdown_version()
+        self.excerpt_html = render_excerpt(self.body_html)
+        self.word_count = count_words(self.body_html)
+
+    def get_body_html(self):
+        if self.body_html_version != markdown_version():
+            return render_markdown(self.body)
+        return self.body_html
+
+    def get_excerpt_html(self):
+        if self.body_html_version != markdown_version():
+            return render_excerpt(render_markdown(self.body))
+        return self.excerpt_html
     
     def get_absolute_url(self):
         return reverse(
@@ -56,6 +156,46 @@ class Post(models.Model):
         )
     
 
+class SimilarPost(models.Model):
+    post = models.ForeignKey(
+        Post,
+        related_name='similar_posts',
+        on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Post,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'rank'],
+                name='blog_similarpost_post_rank_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.similar_id} is similar to {self.post_id} ({self.score})'
+
+
+class CommentQuerySet(models.QuerySet):
+    def set_active(self, active):
+        with transaction.atomic():
+            post_ids = set(self.values_list('post_id', flat=True))
+            updated = self.update(active=active, updated=timezone.now())
+            Post.objects.filter(pk__in=post_ids).recount_comments()
+        bump_versions('comments')
+        bump_pages(*(
+            post.get_absolute_url()
+            for post in Post.objects.filter(pk__in=post_ids).only('slug', 'publish')
+        ))
+        return updated
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -68,11 +208,54 @@ class Comment(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     active = models.BooleanField(default=True)
+    objects = CommentQuerySet.as_manager()
     class Meta:
         ordering = ['created']
         indexes = [
             models.Index(fields=['created']),
+            models.Index(fields=['post', 'active', 'created']),
         ]
     
     def __str__(self):
-        return f'Comment by {self.name} on {self.post}'
\ No newline at end of file
+        return f'Comment by {self.name} on {self.post}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and the post's comment counter, which is adjusted by
+        # the post_save signal, in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class OutboundEmail(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'PD', 'Pending'
+        SENT = 'ST', 'Sent'
+        FAILED = 'FL', 'Failed'
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=2,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.to)}'
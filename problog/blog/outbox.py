@@ -0,0 +1,101 @@
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from blog.models import OutboundEmail
+
+
+# Errors that leave the SMTP connection unusable, it is reopened before the
+# next message.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def enqueue_mail(subject, message, from_email, recipient_list):
+    # Same signature as send_mail(), the "send_outbox" worker delivers it.
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or '',
+        to=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    delay = settings.BLOG_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.BLOG_OUTBOX_MAX_RETRY_DELAY))
+
+
+class Outbox:
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.BLOG_OUTBOX_BATCH_SIZE
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            connection = get_connection()
+            connection.open()
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send_batch(self):
+        sent = failed = 0
+        for email in self.claim():
+            if self.send(email):
+                sent += 1
+            else:
+                failed += 1
+        return sent, failed
+
+    def claim(self):
+        # Leases the due messages in a short transaction, concurrent workers
+        # skip them until the lease ends. Each one is sent and its result
+        # saved on its own, a message is only sent again if the worker died
+        # before saving it.
+        with transaction.atomic():
+            emails = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+                    status=OutboundEmail.Status.PENDING,
+                    next_attempt__lte=timezone.now()
+                ).order_by('next_attempt', 'id')[:self.batch_size]
+            )
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                next_attempt=timezone.now() + timedelta(seconds=settings.BLOG_OUTBOX_LEASE)
+            )
+        return emails
+
+    def send(self, email):
+        message = EmailMessage(
+            email.subject,
+            email.body,
+            email.from_email or None,
+            email.to,
+        )
+        email.attempts += 1
+        try:
+            self.open().send_messages([message])
+        except Exception as error:
+            if isinstance(error, CONNECTION_ERRORS):
+                self.close()
+            email.last_error = f'{type(error).__name__}: {error}'
+            if email.attempts >= settings.BLOG_OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboundEmail.Status.FAILED
+            else:
+                email.next_attempt = timezone.now() + retry_delay(email.attempts)
+            email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt'])
+            return False
+        email.status = OutboundEmail.Status.SENT
+        email.sent = timezone.now()
+        email.save(update_fields=['attempts', 'status', 'sent'])
+        return True
@@ -0,0 +1,110 @@
+import hashlib
+import re
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from blog.cache import get_versions, page_version
+from blog.rendering import markdown_version
+from blog.templatetags.blogtags import (
+    get_most_commented_posts,
+    show_latest_posts,
+    total_posts,
+)
+from frontend.templatetags.uitags import theme_stylesheet
+
+
+CSRF_INPUT = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = '__blog_csrf_token__'
+
+
+def is_anonymous_read(request):
+    # Checked on cookies only, so a cache hit never loads the session.
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def sidebar_digest():
+    # What the sidebar of base.html shows, read from the sidebar cache, so
+    # pages only expire when it really changes.
+    latest = show_latest_posts(3)['latest_posts']
+    trending = get_most_commented_posts()
+    sidebar = [
+        total_posts(),
+        [(post.pk, post.title, post.slug, post.publish) for post in latest],
+        [(post.pk, post.title, post.slug, post.publish) for post in trending],
+    ]
+    return hashlib.sha1(repr(sidebar).encode()).hexdigest()
+
+
+def page_key(request):
+    [version] = get_versions(page_version(request.path))
+    parts = [
+        request.build_absolute_uri(),
+        theme_stylesheet.resolve(),
+        markdown_version(),
+        version,
+        sidebar_digest(),
+    ]
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'blog:page:{digest}'
+
+
+def page_content(response):
+    if response.status_code == 200 and not response.streaming:
+        content = CSRF_INPUT.sub(
+            rf'\g<1>{CSRF_PLACEHOLDER}\g<2>',
+            response.content.decode(response.charset)
+        )
+        return content, response['Content-Type']
+
+
+def page_response(request, page):
+    content, content_type = page
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+    return HttpResponse(content, content_type=content_type)
+
+
+def cache_anonymous_page(view):
+    # Pages are versioned by path, see bump_pages(). The CSRF token of the
+    # comment form is stored as a placeholder and filled in for each reader.
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def cached_async_view(request, *args, **kwargs):
+            if not is_anonymous_read(request):
+                return await view(request, *args, **kwargs)
+            # The key reads the sidebar, which may have to query it.
+            key = await sync_to_async(page_key)(request)
+            page = await cache.aget(key)
+            if page is None:
+                response = await view(request, *args, **kwargs)
+                page = page_content(response)
+                if page is not None:
+                    await cache.aset(key, page, settings.BLOG_CACHE_TIMEOUT)
+                return response
+            return page_response(request, page)
+        return cached_async_view
+
+    @wraps(view)
+    def cached_view(request, *args, **kwargs):
+        if not is_anonymous_read(request):
+            return view(request, *args, **kwargs)
+        key = page_key(request)
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            page = page_content(response)
+            if page is not None:
+                cache.set(key, page, settings.BLOG_CACHE_TIMEOUT)
+            return response
+        return page_response(request, page)
+    return cached_view
@@ -0,0 +1,35 @@
+import hashlib
+
+import markdown
+from django.conf import settings
+from django.template.defaultfilters import truncatewords_html
+from django.utils.html import strip_tags
+
+from blog.instrumentation import timed
+
+
+def markdown_version():
+    signature = repr((
+        markdown.__version__,
+        settings.BLOG_MARKDOWN_EXTENSIONS,
+        settings.BLOG_MARKDOWN_EXTENSION_CONFIGS,
+        settings.BLOG_EXCERPT_WORDS,
+    ))
+    return hashlib.sha1(signature.encode()).hexdigest()[:12]
+
+
+@timed('markdown')
+def render_markdown(text):
+    return markdown.markdown(
+        text,
+        extensions=settings.BLOG_MARKDOWN_EXTENSIONS,
+        extension_configs=settings.BLOG_MARKDOWN_EXTENSION_CONFIGS,
+    )
+
+
+def render_excerpt(html):
+    return truncatewords_html(html, settings.BLOG_EXCERPT_WORDS)
+
+
+def count_words(html):
+    return len(strip_tags(html).split())
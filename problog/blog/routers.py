@@ -0,0 +1,72 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+
+from blog.cache import last_changed
+
+
+current_replica = ContextVar('blog_read_replica', default=None)
+# The published posts with their comments and tags, read by the list, post,
+# search, feed and sitemap pages and the sidebar.
+REPLICA_MODELS = {
+    'blog.post',
+    'blog.comment',
+    'blog.similarpost',
+    'taggit.tag',
+    'taggit.taggeditem',
+}
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def choose_replica(request):
+    # Writes, the admin and clients that wrote in the last PIN_SECONDS read
+    # from the primary. So does everyone right after any change, otherwise a
+    # lagging replica would fill the version-keyed caches with stale pages.
+    if (
+        not settings.BLOG_READ_REPLICAS
+        or request.method not in SAFE_METHODS
+        or settings.BLOG_REPLICA_PIN_COOKIE in request.COOKIES
+        or request.path.startswith(reverse('admin:index'))
+        or time.time() - last_changed('posts', 'comments') < settings.BLOG_REPLICA_PIN_SECONDS
+    ):
+        return None
+    return random.choice(settings.BLOG_READ_REPLICAS)
+
+
+def pin_primary(request, response):
+    if settings.BLOG_READ_REPLICAS and request.method not in SAFE_METHODS:
+        response.set_cookie(
+            settings.BLOG_REPLICA_PIN_COOKIE,
+            '1',
+            max_age=settings.BLOG_REPLICA_PIN_SECONDS,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
+
+
+class ReplicaRouter:
+    # Only routes reads while a request picked a replica, management
+    # commands and everything else use the primary.
+
+    def db_for_read(self, model, **hints):
+        replica = current_replica.get()
+        if replica is not None and model._meta.label_lower in REPLICA_MODELS:
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from a replica would write to
+        # the replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.BLOG_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.db import NotSupportedError, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from blog.models import Post
+
+
+POSTGRES_VECTOR = '''
+    setweight(to_tsvector(coalesce({row}.title, '')), 'A') ||
+    setweight(to_tsvector(coalesce({row}.body, '')), 'B')
+'''
+
+POSTGRES_INSTALL = [
+    'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE INDEX IF NOT EXISTS {table}_search_vector_idx ON {table} USING gin (search_vector)',
+    '''
+    CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := ''' + POSTGRES_VECTOR.format(row='NEW') + ''';
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}',
+    '''
+    CREATE TRIGGER {table}_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, body ON {table}
+    FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()
+    ''',
+    'UPDATE {table} SET search_vector = ' + POSTGRES_VECTOR.format(row='{table}') + ' WHERE search_vector IS NULL',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}',
+    'DROP FUNCTION IF EXISTS {table}_search_vector_update()',
+    'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF title, body ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {table}_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    ''',
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS {table}_fts_insert',
+    'DROP TRIGGER IF EXISTS {table}_fts_delete',
+    'DROP TRIGGER IF EXISTS {table}_fts_update',
+    'DROP TABLE IF EXISTS {table}_fts',
+]
+
+
+def install_search_index(connection):
+    # Idempotent, it also runs after every migrate because SQLite drops the
+    # triggers whenever a migration has to rebuild the posts table.
+    table = Post._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement.format(table=table))
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"title, body, content='{table}', content_rowid='id')"
+            )
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{table}_fts_%']
+            )
+            if cursor.fetchone()[0] < len(SQLITE_TRIGGERS):
+                for statement in SQLITE_TRIGGERS:
+                    cursor.execute(statement.format(table=table))
+                cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    table = Post._meta.db_table
+    statements = {
+        'postgresql': POSTGRES_UNINSTALL,
+        'sqlite': SQLITE_UNINSTALL,
+    }.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(table=table))
+
+
+def search_posts(queryset, query):
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+    if vendor == 'postgresql':
+        rank = RawSQL(
+            f'ts_rank({table}.search_vector, plainto_tsquery(%s))',
+            [query],
+            output_field=FloatField()
+        )
+        matches = RawSQL(
+            f'{table}.search_vector @@ plainto_tsquery(%s)',
+            [query],
+            output_field=BooleanField()
+        )
+        return queryset.filter(matches).annotate(rank=rank).filter(
+            rank__gte=settings.BLOG_SEARCH_MIN_RANK
+        ).order_by('-rank', '-publish')
+    if vendor == 'sqlite':
+        # Every term is quoted so user input is never parsed as FTS5 syntax,
+        # the terms are ANDed like plainto_tsquery does on Postgres.
+        terms = ' '.join(
+            '"{}"'.format(term.replace('"', '""')) for term in query.split()
+        )
+        matches = RawSQL(
+            f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s',
+            [terms]
+        )
+        # bm25() is lower for better matches, the column weights mirror the
+        # A/B weights used on Postgres.
+        rank = RawSQL(
+            f'SELECT -bm25({table}_fts, 1.0, 0.4) FROM {table}_fts '
+            f'WHERE {table}_fts MATCH %s AND {table}_fts.rowid = {table}.id',
+            [terms],
+            output_field=FloatField()
+        )
+        return queryset.filter(id__in=matches).annotate(rank=rank).order_by(
+            '-rank',
+            '-publish'
+        )
+    raise NotSupportedError(f'Post search is not available on {vendor}.')
@@ -0,0 +1,127 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from taggit.models import Tag, TaggedItem
+
+from blog.cache import bump_versions
+from blog.middleware import tag_slugs
+from blog.models import Comment, Post
+from blog.similar import rebuild_similar_posts
+
+
+BATCH_SIZE = 1000
+SEED_AUTHOR = 'seed'
+# Posts are published an hour apart from here, so URLs are the same on
+# every run with the same seed.
+SEED_START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+WORDS = (
+    'trail', 'river', 'canyon', 'ridge', 'camp', 'summit', 'granite', 'pine',
+    'cedar', 'creek', 'gear', 'stove', 'tent', 'rope', 'boots', 'map',
+    'compass', 'weather', 'storm', 'sunrise', 'dusk', 'lake', 'kayak',
+    'paddle', 'bridge', 'valley', 'meadow', 'fire', 'water', 'filter',
+    'guitar', 'chorus', 'album', 'tour', 'stage', 'amplifier', 'drums',
+    'bass', 'melody', 'lyric', 'record', 'studio', 'song', 'night', 'road',
+)
+
+
+def sentence(rng, low=6, high=16):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rng):
+    return ' '.join(sentence(rng) for i in range(rng.randint(2, 6)))
+
+
+def post_body(rng):
+    blocks = []
+    for i in range(rng.randint(2, 5)):
+        blocks.append(f'## {sentence(rng, 2, 5)[:-1]}')
+        blocks.append(paragraph(rng))
+        if rng.random() < 0.3:
+            blocks.append('\n'.join(f'* {sentence(rng, 2, 6)}' for i in range(3)))
+    return '\n\n'.join(blocks)
+
+
+def clear_seed():
+    # Taggit's generic relation does not cascade, the tagged items go first.
+    posts = Post.objects.filter(author__username=SEED_AUTHOR)
+    TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id__in=posts.values('id')
+    ).delete()
+    Tag.objects.filter(
+        slug__startswith=f'{SEED_AUTHOR}-',
+        taggit_taggeditem_items=None
+    ).delete()
+    deleted, rows = posts.delete()
+    bump_versions('posts', 'comments')
+    tag_slugs.invalidate()
+    return rows.get(Post._meta.label, 0)
+
+
+def seed_blog(posts=2000, tags=50, comments=10, seed=0):
+    # Rows are written with bulk_create(), which skips save() and the
+    # signals, the derived columns and caches are filled in here instead.
+    rng = random.Random(seed)
+    author = User.objects.get_or_create(username=SEED_AUTHOR)[0]
+    with transaction.atomic():
+        tag_list = Tag.objects.bulk_create(
+            [
+                Tag(name=f'{SEED_AUTHOR} {word} {i}', slug=f'{SEED_AUTHOR}-{word}-{i}')
+                for i, word in enumerate(rng.choices(WORDS, k=tags))
+            ],
+            batch_size=BATCH_SIZE
+        )
+        post_list = []
+        for i in range(posts):
+            title = sentence(rng, 2, 6)[:-1]
+            post = Post(
+                title=title,
+                slug=f'{title.lower().replace(" ", "-")}-{i}',
+                author=author,
+                body=post_body(rng),
+                publish=SEED_START + timedelta(hours=i),
+                status=(
+                    Post.Status.DRAFT
+                    if rng.random() < 0.05
+                    else Post.Status.PUBLISHED
+                ),
+            )
+            post.render_body()
+            post_list.append(post)
+        post_list = Post.objects.bulk_create(post_list, batch_size=BATCH_SIZE)
+        content_type = ContentType.objects.get_for_model(Post)
+        tagged = []
+        comment_list = []
+        for post in post_list:
+            for tag in rng.sample(tag_list, k=min(len(tag_list), rng.randint(1, 4))):
+                tagged.append(TaggedItem(
+                    content_type=content_type,
+                    object_id=post.id,
+                    tag=tag
+                ))
+            for i in range(rng.randint(0, comments * 2)):
+                name = sentence(rng, 1, 2)[:-1]
+                comment_list.append(Comment(
+                    post=post,
+                    name=name,
+                    email=f'{name.lower().replace(" ", ".")}.{rng.randint(1, 500)}@example.com',
+                    body=paragraph(rng),
+                    active=rng.random() >= 0.1,
+                ))
+        TaggedItem.objects.bulk_create(tagged, batch_size=BATCH_SIZE)
+        Comment.objects.bulk_create(comment_list, batch_size=BATCH_SIZE)
+        Post.objects.filter(author=author).recount_comments()
+    rebuild_similar_posts()
+    bump_versions('posts', 'comments')
+    tag_slugs.invalidate()
+    return {
+        'posts': len(post_list),
+        'tags': len(tag_list),
+        'tagged_items': len(tagged),
+        'comments': len(comment_list),
+    }
@@ -0,0 +1,235 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from blog.cache import bump_pages, bump_versions
+from blog.instrumentation import time_query
+from blog.middleware import tag_slugs
+from blog.models import Post, Comment, SimilarPost
+from blog.search import install_search_index
+from blog.similar import schedule_refresh
+
+
+SIMILARITY_FIELDS = ('status', 'publish')
+
+
+def adjust_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        active_comment_count=F('active_comment_count') + delta
+    )
+
+
+def touch_posts(posts):
+    # Tag changes do not save the post, bump its timestamp so validators and
+    # lastmod dates see them.
+    posts.update(updated=timezone.now())
+
+
+def list_pages(tag_slugs=()):
+    return [
+        reverse('blog:post_list'),
+        *(reverse('blog:post_list_by_tag', args=[slug]) for slug in tag_slugs),
+    ]
+
+
+def tag_pages(tag):
+    # A tag is named on the main list and on the tag pages of every post
+    # carrying it.
+    post_ids = TaggedItem.objects.filter(tag=tag).values('object_id')
+    slugs = TaggedItem.objects.filter(object_id__in=post_ids).values_list(
+        'tag__slug',
+        flat=True
+    ).distinct()
+    return list_pages({tag.slug, *slugs})
+
+
+def counted_post_id(comment):
+    # The post this comment was counted against when it was loaded, or
+    # False when the loaded state is unknown.
+    loaded = getattr(comment, '_loaded_values', None)
+    if loaded is None or 'post_id' not in loaded or 'active' not in loaded:
+        return False
+    return loaded['post_id'] if loaded['active'] else None
+
+
+def comment_post_pages(comment):
+    # Only the columns of the URL, unless the view already set the post.
+    if Comment.post.is_cached(comment):
+        return [comment.post.get_absolute_url()]
+    return [
+        post.get_absolute_url()
+        for post in Post.objects.filter(pk=comment.post_id).only('slug', 'publish')
+    ]
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump_versions('posts')
+
+
+@receiver(post_save, sender=Post)
+def post_pages_changed(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    paths = [
+        instance.get_absolute_url(),
+        *list_pages(instance.tags.values_list('slug', flat=True)),
+        *(
+            post.get_absolute_url()
+            for post in Post.objects.filter(
+                similar_posts__similar=instance
+            ).only('slug', 'publish')
+        ),
+    ]
+    if 'slug' in loaded and 'publish' in loaded:
+        moved_from = Post(slug=loaded['slug'], publish=loaded['publish'])
+        paths.append(moved_from.get_absolute_url())
+    bump_pages(*paths)
+    instance._loaded_values = {**loaded, 'slug': instance.slug}
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    current = {field: getattr(instance, field) for field in SIMILARITY_FIELDS}
+    if created or any(
+        field not in loaded or loaded[field] != value
+        for field, value in current.items()
+    ):
+        schedule_refresh(instance.pk)
+    instance._loaded_values = {**loaded, **current}
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Post):
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_slugs = list(
+            instance.tags.values_list('slug', flat=True)
+        )
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        # Admin saves set the tags even when they did not change, which sends
+        # these with nothing added or removed.
+        if action == 'post_clear':
+            slugs = getattr(instance, '_cleared_tag_slugs', [])
+            if not slugs:
+                return
+        elif not pk_set:
+            return
+        else:
+            slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+        touch_posts(Post.objects.filter(pk=instance.pk))
+        bump_pages(*list_pages(slugs))
+        schedule_refresh(instance.pk)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    instance._similar_listing = list(
+        SimilarPost.objects.filter(similar=instance).values_list('post_id', flat=True)
+    )
+    instance._tag_slugs = list(instance.tags.values_list('slug', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_pages(
+        instance.get_absolute_url(),
+        *list_pages(getattr(instance, '_tag_slugs', []))
+    )
+    listing = set(getattr(instance, '_similar_listing', [])) - {instance.pk}
+    if listing:
+        schedule_refresh(*listing)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    tag_slugs.invalidate()
+
+
+@receiver(pre_save, sender=Tag)
+def tag_saving(sender, instance, **kwargs):
+    instance._previous_slug = Tag.objects.filter(
+        pk=instance.pk
+    ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tagged_posts(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_posts(Post.objects.filter(tags=instance))
+        previous = getattr(instance, '_previous_slug', None)
+        bump_pages(*tag_pages(instance), *list_pages(filter(None, [previous])))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    before = None if created else counted_post_id(instance)
+    after = instance.post_id if instance.active else None
+    if before is False:
+        Post.objects.filter(pk=instance.post_id).recount_comments()
+    elif before != after:
+        if before is not None:
+            adjust_comment_count(before, -1)
+        if after is not None:
+            adjust_comment_count(after, 1)
+    instance._loaded_values = {
+        'post_id': instance.post_id,
+        'active': instance.active,
+    }
+    bump_versions('comments')
+    bump_pages(*comment_post_pages(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting a post cascades to its comments, the post's own signals bump
+    # its pages.
+    if isinstance(origin, Post) or (
+        isinstance(origin, QuerySet) and origin.model is Post
+    ):
+        return
+    # A queryset delete sends this for each row once all of them are gone,
+    # so every post is recounted once.
+    recounted = getattr(origin, '_recounted_posts', set())
+    if instance.post_id in recounted:
+        return
+    recounted.add(instance.post_id)
+    if origin is not None:
+        origin._recounted_posts = recounted
+    Post.objects.filter(pk=instance.post_id).recount_comments()
+    bump_versions('comments')
+    bump_pages(*comment_post_pages(instance))
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    if sender.name != 'blog':
+        return
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('blog', '0008_post_search_index') in applied:
+        install_search_index(connection)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Stays installed for the life of the connection, it only records while
+    # the instrumentation middleware handles a request.
+    if settings.BLOG_INSTRUMENTATION and time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
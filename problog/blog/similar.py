@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+from threading import local
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from taggit.models import TaggedItem
+
+from blog.cache import bump_pages
+from blog.models import Post, SimilarPost
+
+
+CHUNK_SIZE = 500
+_pending = local()
+
+
+def tagged_posts():
+    return TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id__in=Post.published.values('id')
+    )
+
+
+def compute_similar_posts(post_ids=None):
+    items = tagged_posts()
+    source_tags = defaultdict(set)
+    sources = items if post_ids is None else items.filter(object_id__in=post_ids)
+    for post_id, tag_id in sources.values_list('object_id', 'tag_id'):
+        source_tags[post_id].add(tag_id)
+    if post_ids is not None:
+        tag_ids = set().union(*source_tags.values())
+        items = items.filter(tag_id__in=tag_ids)
+    tag_posts = defaultdict(list)
+    for post_id, tag_id in items.values_list('object_id', 'tag_id'):
+        tag_posts[tag_id].append(post_id)
+    candidates = set().union(*tag_posts.values())
+    publish = dict(
+        Post.published.filter(id__in=candidates).values_list('id', 'publish')
+    )
+    rows = []
+    for post_id, tags in source_tags.items():
+        scores = Counter(
+            other
+            for tag_id in tags
+            for other in tag_posts[tag_id]
+            if other != post_id
+        )
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (item[1], publish[item[0]], item[0]),
+            reverse=True
+        )[:settings.BLOG_SIMILAR_POSTS]
+        rows.extend(
+            SimilarPost(post_id=post_id, similar_id=other, score=score, rank=rank)
+            for rank, (other, score) in enumerate(ranked)
+        )
+    return rows
+
+
+def replace_similar_posts(current, rows):
+    with transaction.atomic():
+        before = set(current.values_list('post_id', 'similar_id', 'rank'))
+        current.delete()
+        SimilarPost.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+    # Only the detail pages whose list changed are expired.
+    after = {(row.post_id, row.similar_id, row.rank) for row in rows}
+    changed = {post_id for post_id, *_ in before ^ after}
+    bump_pages(*(
+        post.get_absolute_url()
+        for post in Post.objects.filter(id__in=changed).only('slug', 'publish')
+    ))
+
+
+def rebuild_similar_posts():
+    rows = compute_similar_posts()
+    replace_similar_posts(SimilarPost.objects.all(), rows)
+    return len(rows)
+
+
+def refresh_similar_posts(post_ids):
+    # A change to a post can only move it in or out of the lists that
+    # already name it or of the posts sharing one of its current tags.
+    post_ids = set(post_ids)
+    listing = SimilarPost.objects.filter(
+        similar_id__in=post_ids
+    ).values_list('post_id', flat=True)
+    sharing = tagged_posts().filter(
+        tag_id__in=TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id__in=post_ids
+        ).values('tag_id')
+    ).values_list('object_id', flat=True)
+    affected = sorted(post_ids.union(listing, sharing))
+    for i in range(0, len(affected), CHUNK_SIZE):
+        chunk = affected[i:i + CHUNK_SIZE]
+        replace_similar_posts(
+            SimilarPost.objects.filter(post_id__in=chunk),
+            compute_similar_posts(chunk)
+        )
+    return affected
+
+
+def schedule_refresh(*post_ids):
+    # Changes made in one transaction, e.g. an admin save followed by its tag
+    # updates, are refreshed once after the commit.
+    _pending.ids = getattr(_pending, 'ids', set()) | set(post_ids)
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    post_ids = getattr(_pending, 'ids', None)
+    _pending.ids = set()
+    if post_ids:
+        refresh_similar_posts(post_ids)
@@ -1,14 +1,61 @@
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Count, F, Max
 
 from blog.models import Post
 
 
+def section_range(section):
+    size = settings.BLOG_SITEMAP_SECTION_SIZE
+    return {'id__gte': section * size, 'id__lt': (section + 1) * size}
+
+
+def post_sections():
+    # Sections are fixed id ranges, so a change only alters the section
+    # holding the post.
+    return list(
+        Post.published.order_by().annotate(
+            section=F('id') / settings.BLOG_SITEMAP_SECTION_SIZE
+        ).values('section').annotate(
+            lastmod=Max('updated'),
+            total=Count('id'),
+        ).values_list('section', 'lastmod', 'total').order_by('section')
+    )
+
+
+def post_section(section):
+    current = Post.published.filter(**section_range(section)).aggregate(
+        lastmod=Max('updated'),
+        total=Count('id'),
+    )
+    return current['lastmod'], current['total']
+
+
 class PostSitemap(Sitemap):
     changefreq = 'weekly'
     priority = 0.9
 
+    def __init__(self, section=None):
+        self.section = section
+
     def items(self):
-        return Post.published.all()
+        posts = Post.published.only('slug', 'publish', 'updated').order_by('id')
+        if self.section is not None:
+            posts = posts.filter(**section_range(self.section))
+        return posts
     
     def lastmod(self, obj):
-        return obj.updated
\ No newline at end of file
+        return obj.updated
+
+    def section_urls(self, protocol, domain):
+        # A section is bounded by its id range, stream it instead of
+        # paginating, which would cost a COUNT query.
+        return [
+            {
+                'location': f'{protocol}://{domain}{self.location(post)}',
+                'lastmod': self.lastmod(post),
+                'changefreq': self.changefreq,
+                'priority': str(self.priority),
+            }
+            for post in self.items().iterator(chunk_size=2000)
+        ]
@@ -1,32 +1,61 @@
 from django import template
-from django.db.models import Count
 from django.utils.safestring import mark_safe
-import markdown
 
+from blog.cache import cached
+from blog.instrumentation import timed
 from blog.models import Post
+from blog.rendering import render_markdown
 
 
 register = template.Library()
+SIDEBAR_FIELDS = ('title', 'slug', 'publish')
 
 
 @register.simple_tag
+@timed('sidebar')
 def total_posts():
-    return Post.published.count()
+    return cached(
+        'total_posts',
+        ['posts'],
+        lambda: Post.published.count()
+    )
 
 
 @register.inclusion_tag('blog/post/includes/latest_posts.html')
+@timed('sidebar')
 def show_latest_posts(count=5):
-    latest_posts = Post.published.order_by('-publish')[:count]
+    latest_posts = cached(
+        f'latest_posts:{count}',
+        ['posts'],
+        lambda: list(
+            Post.published.only(*SIDEBAR_FIELDS).order_by('-publish')[:count]
+        )
+    )
     return {'latest_posts': latest_posts}
 
 
 @register.simple_tag
+@timed('sidebar')
 def get_most_commented_posts(count=5):
-    return Post.published.annotate(
-        total_comments=Count('comments')
-    ).order_by('-total_comments')[:count]
+    return cached(
+        f'most_commented_posts:{count}',
+        ['posts', 'comments'],
+        lambda: list(
+            Post.published.only(*SIDEBAR_FIELDS).order_by(
+                '-active_comment_count',
+                '-publish'
+            )[:count]
+        )
+    )
 
 
 @register.filter(name='markdown')
-def markdown_format(text):
-    return mark_safe(markdown.markdown(text))
\ No newline at end of file
+def markdown_format(value):
+    if isinstance(value, Post):
+        return mark_safe(value.get_body_html())
+    return mark_safe(render_markdown(value))
+
+
+@register.filter
+def excerpt(post):
+    return mark_safe(post.get_excerpt_html())
\ No newline at end of file
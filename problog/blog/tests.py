@@ -1,3 +1,1500 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import re
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count
+from django.template import Context, Template
+from django.http import Http404
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from taggit.models import Tag
+
+from blog import async_views, views
+from blog.benchmark import Benchmark
+from blog.cache import bump_versions, changed_key
+from blog.export import Exporter
+from blog.instrumentation import RequestTimings, view_stats
+from blog.middleware import tag_slugs
+from blog.models import Post, Comment, OutboundEmail
+from blog.outbox import Outbox
+from blog.pagecache import CSRF_INPUT
+from blog.rendering import markdown_version
+from blog.routers import current_replica
+from blog.seed import clear_seed, seed_blog
+from blog.similar import rebuild_similar_posts
+from problog.timing import current_timings, timer
+
+
+# Valid base64 and JSON, but not values of the ordering fields.
+MALFORMED_CURSORS = [
+    [{}, 1],
+    [None, None],
+    [True, 'x'],
+    [1e400, 1],
+    ['2024-01-01T00:00:00', 10 ** 20],
+    ['2024-13-45', 1],
+]
+
+
+def encode_cursor(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+class MarkdownRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            title='Rendered post',
+            slug='rendered-post',
+            author=User.objects.create_user('author'),
+            body='Some **bold** words.',
+            status=Post.Status.PUBLISHED,
+        )
+
+    def test_body_is_rendered_on_save(self):
+        self.assertIn('<strong>bold</strong>', self.post.body_html)
+        self.assertEqual(self.post.body_html_version, markdown_version())
+        self.assertEqual(self.post.word_count, 3)
+        self.post.body = 'Now *emphasised*.'
+        self.post.save(update_fields=['body'])
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIn('<em>emphasised</em>', post.body_html)
+        self.assertEqual(post.word_count, 2)
+
+    def test_command_renders_stale_posts(self):
+        Post.objects.update(body_html='', body_html_version='stale', excerpt_html='', word_count=0)
+        output = StringIO()
+        call_command('render_markdown', stdout=output)
+        self.assertIn('Rendered the Markdown body of 1 posts', output.getvalue())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIn('<strong>bold</strong>', post.body_html)
+        self.assertEqual(post.body_html_version, markdown_version())
+        self.assertIn('<strong>bold</strong>', post.excerpt_html)
+        self.assertEqual(post.word_count, 3)
+        output = StringIO()
+        call_command('render_markdown', stdout=output)
+        self.assertIn('Rendered the Markdown body of 0 posts', output.getvalue())
+
+
+class ExcerptListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            title='Long post',
+            slug='long-post',
+            author=User.objects.create_user('author'),
+            body=' '.join(f'word{i}' for i in range(50)),
+            status=Post.Status.PUBLISHED,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listings_do_not_load_the_body(self):
+        for url in (reverse('blog:post_list'), reverse('blog:post_feed')):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                self.assertContains(response, 'word29')
+                self.assertNotContains(response, 'word30')
+            post_queries = [query['sql'] for query in queries if 'FROM "blog_post"' in query['sql']]
+            self.assertTrue(post_queries)
+            for sql in post_queries:
+                self.assertNotIn('"blog_post"."body"', sql)
+                self.assertNotIn('"blog_post"."body_html"', sql)
+
+    @override_settings(BLOG_EXCERPT_WORDS=3)
+    def test_excerpt_follows_the_body(self):
+        self.post.body = 'One **two** three four five.'
+        self.post.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.excerpt_html, '<p>One <strong>two</strong> three …</p>')
+        self.assertEqual(post.word_count, 5)
+
+
+class PostListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        for i in range(12):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body=f'Body of **post {i}**.',
+                status=Post.Status.PUBLISHED,
+            )
+            post.tags.add('music', f'topic-{i}', f'extra-{i}')
+            Comment.objects.create(
+                post=post,
+                name='Reader',
+                email='reader@example.com',
+                body='Nice post.',
+            )
+
+    def count_queries(self, url, per_page):
+        cache.clear()
+        with override_settings(BLOG_POSTS_PER_PAGE=per_page):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), per_page)
+        return len(queries)
+
+    def test_post_list_query_count_is_independent_of_page_size(self):
+        url = reverse('blog:post_list')
+        self.assertEqual(
+            self.count_queries(url, 3),
+            self.count_queries(url, 10),
+        )
+
+    def test_tag_list_query_count_is_independent_of_page_size(self):
+        url = reverse('blog:post_list_by_tag', args=['music'])
+        self.assertEqual(
+            self.count_queries(url, 3),
+            self.count_queries(url, 10),
+        )
+
+    def test_feed_query_count_is_independent_of_tag_count(self):
+        Post.published.first().tags.add('one', 'two', 'three')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:post_feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 3)
+
+
+class QueryBudgetTests(TestCase):
+    # Queries of a cold render, sidebar included. They must not grow with
+    # the page size or the number of comments and tags shown.
+    BUDGETS = {
+        'post_list': 6,
+        'post_list_page': 7,
+        'post_list_by_tag': 7,
+        'post_detail': 8,
+        'post_comments': 2,
+        'post_search': 6,
+        'post_feed': 4,
+        'post_feed_by_tag': 5,
+        'sitemap': 2,
+        'sitemap_section': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_blog(posts=60, tags=10, comments=8, seed=1)
+        cls.post = Post.published.order_by('-active_comment_count', 'id').first()
+        cls.tag = Tag.objects.annotate(
+            total=Count('taggit_taggeditem_items')
+        ).order_by('-total', 'id').first()
+
+    def urls(self):
+        return {
+            'post_list': reverse('blog:post_list'),
+            'post_list_page': f'{reverse("blog:post_list")}?page=2',
+            'post_list_by_tag': reverse('blog:post_list_by_tag', args=[self.tag.slug]),
+            'post_detail': self.post.get_absolute_url(),
+            'post_comments': reverse('blog:post_comments', args=[self.post.id]),
+            'post_search': f'{reverse("blog:post_search")}?query=trail',
+            'post_feed': reverse('blog:post_feed'),
+            'post_feed_by_tag': reverse('blog:post_feed_by_tag', args=[self.tag.slug]),
+            'sitemap': reverse('sitemap'),
+            'sitemap_section': reverse(
+                'sitemap_section',
+                args=[self.post.id // settings.BLOG_SITEMAP_SECTION_SIZE]
+            ),
+        }
+
+    def count_queries(self, name, url):
+        cache.clear()
+        Site.objects.clear_cache()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        budget = self.BUDGETS[name]
+        if len(queries) > budget:
+            statements = '\n'.join(
+                f'{i}. {query["sql"]}'
+                for i, query in enumerate(queries.captured_queries, 1)
+            )
+            self.fail(f'{name} ({url}) ran {len(queries)} queries, its budget is {budget}:\n{statements}')
+        return len(queries)
+
+    def assertWithinBudget(self, **overrides):
+        with override_settings(**overrides):
+            return {
+                name: self.count_queries(name, url)
+                for name, url in self.urls().items()
+            }
+
+    def test_views_stay_within_budget_for_any_page_size(self):
+        small = self.assertWithinBudget(
+            BLOG_POSTS_PER_PAGE=3,
+            BLOG_COMMENTS_PER_PAGE=3,
+            BLOG_SEARCH_RESULTS_PER_PAGE=3,
+        )
+        large = self.assertWithinBudget(
+            BLOG_POSTS_PER_PAGE=15,
+            BLOG_COMMENTS_PER_PAGE=15,
+            BLOG_SEARCH_RESULTS_PER_PAGE=15,
+        )
+        self.assertEqual(small, large)
+
+    def test_views_stay_within_budget_with_more_tags_and_comments(self):
+        before = self.assertWithinBudget()
+        for post in Post.published.all():
+            post.tags.add(*(f'extra-{i}' for i in range(5)))
+        Comment.objects.bulk_create([
+            Comment(
+                post=self.post,
+                name=f'Reader {i}',
+                email='reader@example.com',
+                body='Nice post.',
+            )
+            for i in range(30)
+        ])
+        Post.objects.recount_comments()
+        self.assertEqual(self.assertWithinBudget(), before)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        publish = timezone.now()
+        for i in range(7):
+            Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body='Body.',
+                status=Post.Status.PUBLISHED,
+                # Pairs of posts share a publish date to exercise the id tie-break.
+                publish=publish - timedelta(days=i // 2),
+            )
+
+    def titles(self, response):
+        return [post.title for post in response.context['posts']]
+
+    @override_settings(BLOG_POSTS_PER_PAGE=3, BLOG_PAGINATION='keyset')
+    def test_walk_older_and_newer_pages(self):
+        url = reverse('blog:post_list')
+        expected = list(
+            Post.published.order_by('-publish', '-id').values_list('title', flat=True)
+        )
+        first = self.client.get(url)
+        self.assertEqual(self.titles(first), expected[:3])
+        page = first.context['posts']
+        second = self.client.get(url, {'after': page.next_cursor})
+        self.assertEqual(self.titles(second), expected[3:6])
+        third = self.client.get(url, {'after': second.context['posts'].next_cursor})
+        self.assertEqual(self.titles(third), expected[6:])
+        self.assertIsNone(third.context['posts'].next_cursor)
+        back = self.client.get(url, {'before': third.context['posts'].previous_cursor})
+        self.assertEqual(self.titles(back), expected[3:6])
+
+    @override_settings(BLOG_POSTS_PER_PAGE=3, BLOG_PAGINATION='keyset')
+    def test_page_number_urls_keep_working(self):
+        response = self.client.get(reverse('blog:post_list'), {'page': 3})
+        self.assertEqual(response.context['posts'].number, 3)
+
+    @override_settings(BLOG_POSTS_PER_PAGE=3, BLOG_PAGINATION='keyset')
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('blog:post_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(len(response.context['posts']), 3)
+        self.assertFalse(response.context['posts'].has_previous())
+
+    @override_settings(BLOG_POSTS_PER_PAGE=3, BLOG_PAGINATION='keyset')
+    def test_malformed_cursors_fall_back_to_first_page(self):
+        Post.published.first().tags.add('music')
+        urls = [
+            reverse('blog:post_list'),
+            reverse('blog:post_list_by_tag', args=['music']),
+        ]
+        for values in MALFORMED_CURSORS:
+            for url in urls:
+                with self.subTest(values=values, url=url):
+                    response = self.client.get(url, {'after': encode_cursor(values)})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(response.context['posts'].has_previous())
+                    response = self.client.get(url, {'before': encode_cursor(values)})
+                    self.assertEqual(response.status_code, 200)
+
+
+class SidebarCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.post = Post.objects.create(
+            title='First post',
+            slug='first-post',
+            author=cls.author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render_sidebar(self):
+        return Template(
+            '{% load blogtags %}{% total_posts %}|{% show_latest_posts 3 %}'
+            '{% get_most_commented_posts as trending %}'
+            '{% for post in trending %}[{{ post.title }}]{% endfor %}'
+        ).render(Context())
+
+    def test_warm_sidebar_costs_no_queries(self):
+        self.render_sidebar()
+        with self.assertNumQueries(0):
+            self.render_sidebar()
+
+    def test_publishing_a_post_refreshes_the_sidebar(self):
+        self.render_sidebar()
+        Post.objects.create(
+            title='Second post',
+            slug='second-post',
+            author=self.author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+        html = self.render_sidebar()
+        self.assertTrue(html.startswith('2|'))
+        self.assertIn('Second post', html)
+
+    def test_new_comment_refreshes_trending(self):
+        other = Post.objects.create(
+            title='Second post',
+            slug='second-post',
+            author=self.author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+        self.render_sidebar()
+        for i in range(2):
+            Comment.objects.create(
+                post=other,
+                name='Reader',
+                email='reader@example.com',
+                body='Nice post.',
+            )
+        html = self.render_sidebar()
+        self.assertTrue(html.endswith('[Second post][First post]'))
+
+
+class CommentCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.post = Post.objects.create(
+            title='First post',
+            slug='first-post',
+            author=cls.author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+
+    def add_comment(self, **kwargs):
+        return Comment.objects.create(
+            post=self.post,
+            name='Reader',
+            email='reader@example.com',
+            body='Nice post.',
+            **kwargs
+        )
+
+    def assertCount(self, expected):
+        self.post.refresh_from_db(fields=['active_comment_count'])
+        self.assertEqual(self.post.active_comment_count, expected)
+
+    def test_counter_follows_create_toggle_and_delete(self):
+        comment = self.add_comment()
+        self.add_comment(active=False)
+        self.assertCount(1)
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.active = False
+        comment.save()
+        self.assertCount(0)
+        comment.active = True
+        comment.save()
+        self.assertCount(1)
+        comment.delete()
+        self.assertCount(0)
+
+    def test_bulk_actions_keep_counter_in_sync(self):
+        for i in range(3):
+            self.add_comment(active=False)
+        Comment.objects.filter(post=self.post).set_active(True)
+        self.assertCount(3)
+        Comment.objects.filter(post=self.post).first().delete()
+        self.assertCount(2)
+        Comment.objects.filter(post=self.post).delete()
+        self.assertCount(0)
+
+    def test_deleting_a_post_skips_the_comment_handlers(self):
+        for i in range(5):
+            self.add_comment()
+        # Cached from here on, as in a running process.
+        ContentType.objects.get_for_model(Post)
+        with self.assertNumQueries(7):
+            self.post.delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_bulk_delete_recounts_each_post_once(self):
+        for i in range(5):
+            self.add_comment()
+        with self.assertNumQueries(4):
+            Comment.objects.filter(post=self.post).delete()
+        self.assertCount(0)
+
+    def test_saving_a_stale_post_keeps_the_counter(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.add_comment()
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertCount(1)
+
+    def test_recount_repairs_counters(self):
+        self.add_comment()
+        Post.objects.update(active_comment_count=42)
+        Post.objects.recount_comments()
+        self.assertCount(1)
+
+
+@override_settings(BLOG_COMMENTS_PER_PAGE=2)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.post = Post.objects.create(
+            title='First post',
+            slug='first-post',
+            author=author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+        for i in range(5):
+            Comment.objects.create(
+                post=cls.post,
+                name=f'Reader {i}',
+                email='reader@example.com',
+                body='Nice post.',
+                active=i != 2,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, response):
+        return re.findall(r'card-header-title">([^<]*)<', response.content.decode())
+
+    def more_url(self, response):
+        found = re.search(r'data-comments-url="([^"]*)"', response.content.decode())
+        return found and found.group(1).replace('&amp;', '&')
+
+    def test_detail_shows_first_page_and_fragments_load_the_rest(self):
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, '4 Comments')
+        names = self.names(response)
+        self.assertEqual(names, ['Reader 0', 'Reader 1'])
+        url = self.more_url(response)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += self.names(response)
+            url = self.more_url(response)
+        self.assertEqual(names, ['Reader 0', 'Reader 1', 'Reader 3', 'Reader 4'])
+
+    def test_fragment_reads_the_post_and_one_page(self):
+        url = reverse('blog:post_comments', args=[self.post.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(self.names(response), ['Reader 0', 'Reader 1'])
+
+    def test_fragment_rejects_bad_cursors_and_drafts(self):
+        url = reverse('blog:post_comments', args=[self.post.id])
+        response = self.client.get(url, {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        for values in MALFORMED_CURSORS:
+            with self.subTest(values=values):
+                response = self.client.get(url, {'after': encode_cursor(values)})
+                self.assertEqual(response.status_code, 400)
+        Post.objects.filter(pk=self.post.pk).update(status=Post.Status.DRAFT)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/blog/99999999999999999999/comments/')
+        self.assertEqual(response.status_code, 404)
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.title_match = Post.objects.create(
+            title='Guitar pedals',
+            slug='guitar-pedals',
+            author=author,
+            body='A rundown of our live rig.',
+            status=Post.Status.PUBLISHED,
+        )
+        cls.body_match = Post.objects.create(
+            title='Tour diary',
+            slug='tour-diary',
+            author=author,
+            body='The guitar amp blew up on the second night.',
+            status=Post.Status.PUBLISHED,
+        )
+        Post.objects.create(
+            title='Unreleased guitar demo',
+            slug='unreleased-guitar-demo',
+            author=author,
+            body='Draft.',
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('blog:post_search'),
+            {'query': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [post.title for post in response.context['results']]
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.assertEqual(self.search('guitar'), ['Guitar pedals', 'Tour diary'])
+
+    def test_terms_are_matched_together_and_syntax_is_ignored(self):
+        self.assertEqual(self.search('guitar amp'), ['Tour diary'])
+        self.assertEqual(self.search('"guitar OR ('), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.body_match.body = 'Nothing left to see.'
+        self.body_match.save()
+        self.assertEqual(self.search('guitar'), ['Guitar pedals'])
+        self.title_match.delete()
+        self.assertEqual(self.search('guitar'), [])
+
+    @override_settings(BLOG_SEARCH_RESULTS_PER_PAGE=1, BLOG_SEARCH_MAX_RESULTS=1)
+    def test_results_are_bounded_and_paginated(self):
+        self.assertEqual(self.search('guitar'), ['Guitar pedals'])
+        self.assertEqual(self.search('guitar', page=2), ['Guitar pedals'])
+
+
+class SimilarPostsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+
+    def create_post(self, slug, *tags, days_ago=0, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title=slug.title(),
+                slug=slug,
+                author=self.author,
+                body='Body.',
+                status=Post.Status.PUBLISHED,
+                publish=timezone.now() - timedelta(days=days_ago),
+                **kwargs
+            )
+            post.tags.add(*tags)
+        return post
+
+    def similar(self, post):
+        response = self.client.get(post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        return [similar.slug for similar in response.context['similar_posts']]
+
+    def test_similar_posts_are_ranked_by_shared_tags_then_date(self):
+        post = self.create_post('origin', 'rock', 'live', 'tour')
+        self.create_post('one-tag', 'rock', days_ago=1)
+        self.create_post('two-tags', 'rock', 'live', days_ago=3)
+        self.create_post('one-tag-newer', 'tour')
+        self.create_post('unrelated', 'jazz')
+        self.assertEqual(self.similar(post), ['two-tags', 'one-tag-newer', 'one-tag'])
+
+    def test_tag_and_status_changes_refresh_neighbours(self):
+        post = self.create_post('origin', 'rock')
+        other = self.create_post('other', 'jazz')
+        self.assertEqual(self.similar(post), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.tags.add('rock')
+        self.assertEqual(self.similar(post), ['other'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.status = Post.Status.DRAFT
+            other.save()
+        self.assertEqual(self.similar(post), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.status = Post.Status.PUBLISHED
+            other.save()
+            other.tags.clear()
+        self.assertEqual(self.similar(post), [])
+
+    def test_setting_the_same_tags_changes_nothing(self):
+        post = self.create_post('origin', 'rock', 'live')
+        updated = Post.objects.get(pk=post.pk).updated
+        with patch('blog.signals.schedule_refresh') as schedule_refresh, \
+                patch('blog.signals.bump_pages') as bump_pages:
+            post.tags.set(['live', 'rock'])
+            Post.objects.get(pk=post.pk).tags.set(['rock', 'live'])
+            post.tags.remove('jazz')
+        schedule_refresh.assert_not_called()
+        bump_pages.assert_not_called()
+        self.assertEqual(Post.objects.get(pk=post.pk).updated, updated)
+
+    def test_deleting_a_post_backfills_the_lists_that_named_it(self):
+        post = self.create_post('origin', 'rock')
+        doomed = self.create_post('doomed', 'rock')
+        self.create_post('spare', 'rock', days_ago=1)
+        with self.settings(BLOG_SIMILAR_POSTS=1):
+            rebuild_similar_posts()
+            self.assertEqual(self.similar(post), ['doomed'])
+            with self.captureOnCommitCallbacks(execute=True):
+                doomed.delete()
+            self.assertEqual(self.similar(post), ['spare'])
+
+
+@override_settings(ALLOWED_HOSTS=['.example.com'])
+class SubdomainTagTests(TestCase):
+    def setUp(self):
+        tag_slugs.invalidate()
+        Tag.objects.create(name='Music', slug='music')
+
+    def test_known_tag_redirects_permanently_and_is_cacheable(self):
+        self.client.get('/', HTTP_HOST='music.blog.example.com')
+        with self.assertNumQueries(0):
+            response = self.client.get('/', HTTP_HOST='music.blog.example.com')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://blog.example.com/blog/tag/music/')
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_unknown_subdomains_are_answered_from_memory(self):
+        self.client.get('/', HTTP_HOST='music.blog.example.com')
+        with self.assertNumQueries(0):
+            for slug in ('spam', 'more-spam', 'even-more-spam'):
+                response = self.client.get('/', HTTP_HOST=f'{slug}.blog.example.com')
+                self.assertEqual(response.status_code, 404)
+
+    def test_new_tags_invalidate_the_slug_set(self):
+        self.client.get('/', HTTP_HOST='jazz.blog.example.com')
+        Tag.objects.create(name='Jazz', slug='jazz')
+        response = self.client.get('/', HTTP_HOST='jazz.blog.example.com')
+        self.assertEqual(response.status_code, 301)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.post = Post.objects.create(
+            title='First post',
+            slug='first-post',
+            author=cls.author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+        cls.post.tags.add('music')
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, **headers):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+
+    def test_unchanged_pages_answer_not_modified_with_one_query(self):
+        urls = [
+            reverse('blog:post_list'),
+            reverse('blog:post_list_by_tag', args=['music']),
+            self.post.get_absolute_url(),
+            reverse('blog:post_feed'),
+            reverse('sitemap'),
+            reverse('sitemap_section', args=[0]),
+        ]
+        for url in urls:
+            # The first detail response sets the CSRF cookie.
+            self.client.get(url)
+            response = self.client.get(url)
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_if_modified_since_is_answered(self):
+        url = reverse('blog:post_feed')
+        response = self.client.get(url)
+        response = self.client.get(
+            url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_edits_comments_and_tags_change_the_validators(self):
+        url = self.post.get_absolute_url()
+        self.client.get(url)
+        changes = [
+            lambda: Post.objects.get(pk=self.post.pk).save(),
+            lambda: Comment.objects.create(
+                post=self.post,
+                name='Reader',
+                email='reader@example.com',
+                body='Nice post.',
+            ),
+            lambda: Comment.objects.all().set_active(False),
+            lambda: self.post.tags.add('jazz'),
+        ]
+        for change in changes:
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_missing_objects_are_not_validated(self):
+        response = self.client.get(
+            reverse('blog:post_list_by_tag', args=['missing']),
+            HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        publish = timezone.now()
+        cls.posts = []
+        for i in range(8):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body=f'Body {i}.',
+                publish=publish - timedelta(days=i),
+                status=Post.Status.PUBLISHED,
+            )
+            cls.posts.append(post)
+        cls.posts[0].tags.add('music')
+
+    def setUp(self):
+        cache.clear()
+
+    def warm(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_cached_pages_only_cost_the_validator_query(self):
+        for url in (
+            reverse('blog:post_list'),
+            reverse('blog:post_list_by_tag', args=['music']),
+            self.posts[0].get_absolute_url(),
+        ):
+            self.warm(url)
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_cached_comment_form_gets_a_fresh_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        url = self.posts[0].get_absolute_url()
+        self.warm(url)
+        response = client.get(url)
+        self.assertNotContains(response, '__blog_csrf_token__')
+        self.assertIsNone(response.context)
+        token = re.search(
+            r'name="csrfmiddlewaretoken" value="([^"]+)"',
+            response.content.decode()
+        ).group(1)
+        response = client.post(
+            reverse('blog:post_comment', args=[self.posts[0].id]),
+            {
+                'name': 'Reader',
+                'email': 'reader@example.com',
+                'body': 'Nice post.',
+                'csrfmiddlewaretoken': token,
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(self.client.get(url), 'Nice post.')
+
+    def test_changes_expire_the_pages_showing_them(self):
+        post, other = self.posts[6], self.posts[7]
+        list_url = reverse('blog:post_list_by_tag', args=['music'])
+        for url in (post.get_absolute_url(), other.get_absolute_url(), list_url):
+            self.warm(url)
+        post.body = 'Edited body.'
+        post.save()
+        self.assertContains(self.client.get(post.get_absolute_url()), 'Edited body.')
+        with self.assertNumQueries(1):
+            self.client.get(other.get_absolute_url())
+        post.tags.add('music')
+        self.assertContains(self.client.get(list_url), 'Post 6')
+        Comment.objects.create(
+            post=other,
+            name='Reader',
+            email='reader@example.com',
+            body='Late comment.',
+            active=False,
+        )
+        Comment.objects.filter(post=other).set_active(True)
+        self.assertContains(self.client.get(other.get_absolute_url()), 'Late comment.')
+
+    def test_sessions_bypass_the_cache(self):
+        url = reverse('blog:post_list')
+        self.warm(url)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'session'
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        publish = timezone.now()
+        cls.posts = []
+        for i in range(4):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body=f'Body {i} about guitars.',
+                publish=publish - timedelta(days=i),
+                status=Post.Status.PUBLISHED,
+            )
+            post.tags.add('music')
+            cls.posts.append(post)
+        Comment.objects.create(
+            post=cls.posts[0],
+            name='Reader',
+            email='reader@example.com',
+            body='Nice post.',
+        )
+        rebuild_similar_posts()
+
+    def setUp(self):
+        cache.clear()
+
+    def content(self, response):
+        return CSRF_INPUT.sub(r'\g<1>\g<2>', response.content.decode())
+
+    def assertSamePage(self, view, path, *args, **kwargs):
+        expected = getattr(views, view)(RequestFactory().get(path), *args, **kwargs)
+        cache.clear()
+        request = AsyncRequestFactory().get(path)
+        response = async_to_sync(getattr(async_views, view))(request, *args, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.content(expected))
+        return response
+
+    def test_async_pages_match_the_sync_pages(self):
+        post = self.posts[0]
+        self.assertSamePage('post_list', reverse('blog:post_list'))
+        self.assertSamePage(
+            'post_list',
+            reverse('blog:post_list_by_tag', args=['music']),
+            tag_slug='music'
+        )
+        self.assertSamePage(
+            'post_detail',
+            post.get_absolute_url(),
+            post.publish.year,
+            post.publish.month,
+            post.publish.day,
+            post.slug
+        )
+        self.assertSamePage('post_search', f'{reverse("blog:post_search")}?query=guitars')
+
+    def test_async_pages_are_validated_and_cached(self):
+        get = async_to_sync(async_views.post_list)
+        path = reverse('blog:post_list')
+        response = get(AsyncRequestFactory().get(path))
+        request = AsyncRequestFactory().get(
+            path,
+            headers={'If-None-Match': response['ETag']}
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(get(request).status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(get(AsyncRequestFactory().get(path)).status_code, 200)
+        path = reverse('blog:post_list_by_tag', args=['missing'])
+        with self.assertRaises(Http404):
+            get(AsyncRequestFactory().get(path), tag_slug='missing')
+
+    def test_async_feed(self):
+        path = reverse('blog:post_feed')
+        response = async_to_sync(async_views.post_feed)(AsyncRequestFactory().get(path))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Post 3')
+        self.assertTrue(response.has_header('ETag'))
+
+
+    def query_thread(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return threading.get_ident()
+
+    def connection_closes(self, max_age):
+        # Two queries on a fresh worker thread, as gather() runs them.
+        def worker():
+            for i in range(2):
+                async_views.run_query(self.query_thread)
+
+        wrapper = type(connections['default'])
+        with patch.dict(connections.settings['default'], {'CONN_MAX_AGE': max_age}), \
+                patch.object(wrapper, 'close', autospec=True) as close:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        return close.call_count
+
+    @override_settings(BLOG_ASYNC_PARALLEL_QUERIES=True)
+    def test_parallel_queries_reuse_their_connections(self):
+        threads = async_to_sync(async_views.gather)(self.query_thread, self.query_thread)
+        self.assertNotIn(threading.get_ident(), threads)
+        # Without CONN_MAX_AGE every query connects and disconnects.
+        self.assertEqual(self.connection_closes(0), 3)
+        self.assertEqual(self.connection_closes(60), 0)
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.post = Post.objects.create(
+            title='First post',
+            slug='first-post',
+            author=cls.staff,
+            body='Some **bold** words.',
+            status=Post.Status.PUBLISHED,
+        )
+
+    def setUp(self):
+        cache.clear()
+        view_stats.clear()
+
+    def test_server_timing_is_only_sent_to_staff(self):
+        url = self.post.get_absolute_url()
+        self.assertFalse(self.client.get(url).has_header('Server-Timing'))
+        self.client.force_login(self.staff)
+        # A stale render version renders the Markdown again.
+        Post.objects.update(body_html_version='')
+        header = self.client.get(url)['Server-Timing']
+        metrics = [
+            'queries;desc=',
+            'sql;dur=',
+            'template;dur=',
+            'sidebar;dur=',
+            'forms;dur=',
+            'markdown;dur=',
+            'total;dur=',
+        ]
+        for metric in metrics:
+            self.assertIn(metric, header)
+
+    def test_parallel_timers_are_all_counted(self):
+        timings = RequestTimings()
+        barrier = threading.Barrier(2)
+        def sidebar():
+            current_timings.set(timings)
+            with timer('sidebar'):
+                with timer('sidebar'):
+                    barrier.wait()
+                    time.sleep(0.05)
+        threads = [threading.Thread(target=sidebar) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(timings.durations['sidebar'], 0.1)
+
+    def test_stats_page_aggregates_requests_per_view(self):
+        for i in range(3):
+            self.client.get(reverse('blog:post_list'))
+        stats = reverse('blog:request_stats')
+        self.assertEqual(self.client.get(stats).status_code, 302)
+        [view] = [
+            view for view in view_stats.summary()
+            if view['name'] == 'blog:post_list'
+        ]
+        self.assertEqual(view['requests'], 3)
+        self.assertGreater(view['queries'], 0)
+        self.assertTrue(view['slowest'])
+        self.client.force_login(self.staff)
+        response = self.client.get(stats)
+        self.assertContains(response, 'blog:post_list')
+        self.assertContains(response, 'Slowest statements')
+
+
+class ExportStaticTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        publish = timezone.now()
+        cls.posts = []
+        for i in range(4):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body=f'Body {i}.',
+                publish=publish - timedelta(days=i),
+                status=Post.Status.PUBLISHED,
+            )
+            post.tags.add('music')
+            cls.posts.append(post)
+
+    def setUp(self):
+        cache.clear()
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        self.exporter = Exporter(self.root, 'http://testserver')
+
+    def page(self, path):
+        return self.root / path.lstrip('/') / 'index.html'
+
+    def test_full_export_writes_every_page(self):
+        self.exporter.export()
+        for post in self.posts:
+            html = self.page(post.get_absolute_url()).read_text()
+            self.assertIn(post.title, html)
+            self.assertIn('name="csrfmiddlewaretoken" value=""', html)
+        # Keyset lists link their older pages through Django.
+        self.assertIn('?after=', self.page('blog').read_text())
+        self.assertTrue(self.page('blog/tag/music').exists())
+        self.assertFalse(self.page('blog/page/2').exists())
+        self.assertTrue((self.root / 'blog/feed/index.xml').exists())
+        self.assertTrue((self.root / 'sitemap.xml').exists())
+
+    @override_settings(BLOG_PAGINATION='page')
+    def test_numbered_lists_export_every_page(self):
+        self.exporter.export()
+        for path in ('blog', 'blog/page/2', 'blog/tag/music/page/2'):
+            self.assertTrue(self.page(path).exists(), path)
+        self.assertIn('?page=2', self.page('blog').read_text())
+
+    def test_watch_exports_after_changes(self):
+        sleeps = iter([None, KeyboardInterrupt])
+
+        def sleep(interval):
+            # A change between the polls is exported by the next one.
+            self.posts[0].title = 'Renamed'
+            self.posts[0].save()
+            if (result := next(sleeps)) is not None:
+                raise result
+
+        with patch('blog.management.commands.export_static.time.sleep', sleep):
+            call_command(
+                'export_static',
+                watch=True,
+                output=self.root,
+                url='http://testserver',
+                jobs=1,
+                stdout=StringIO()
+            )
+        self.assertIn('Renamed', self.page(self.posts[0].get_absolute_url()).read_text())
+
+    def test_incremental_export_only_renders_changed_pages(self):
+        self.exporter.export()
+        paths, removed = self.exporter.export()
+        self.assertEqual(paths, [])
+        post = self.posts[3]
+        post.body = 'Edited body.'
+        post.save()
+        paths, removed = self.exporter.export()
+        self.assertIn(post.get_absolute_url(), paths)
+        self.assertIn('Edited body.', self.page(post.get_absolute_url()).read_text())
+        self.assertNotIn(self.posts[2].get_absolute_url(), paths)
+
+    @override_settings(BLOG_PAGINATION='page')
+    def test_removed_posts_and_pages_are_deleted(self):
+        self.exporter.export()
+        post = self.posts[3]
+        post.delete()
+        paths, removed = self.exporter.export()
+        self.assertFalse(self.page(post.get_absolute_url()).exists())
+        self.assertFalse(self.page('blog/page/2').exists())
+        self.assertIn('blog/page/2/index.html', removed)
+
+
+@override_settings(BLOG_SITEMAP_SECTION_SIZE=2)
+class SitemapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.posts = [
+            Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=author,
+                body=f'Body {i}.',
+                status=Post.Status.PUBLISHED,
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def section(self, post):
+        return reverse('sitemap_section', args=[post.pk // 2])
+
+    def test_index_lists_one_section_per_id_range(self):
+        Site.objects.clear_cache()
+        # The sections aggregate and the current site.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('sitemap'))
+        sections = {self.section(post) for post in self.posts}
+        self.assertEqual(response.content.decode().count('<sitemap>'), len(sections))
+        for section in sections:
+            self.assertContains(response, section)
+
+    def test_sections_are_cached_until_one_of_their_posts_changes(self):
+        post, other = self.posts[0], self.posts[-1]
+        self.assertContains(self.client.get(self.section(post)), post.get_absolute_url())
+        with self.assertNumQueries(1):
+            response = self.client.get(self.section(post))
+        self.assertContains(response, post.get_absolute_url())
+        other.save()
+        with self.assertNumQueries(1):
+            self.client.get(self.section(post))
+        post.slug = 'moved'
+        post.save()
+        self.assertContains(self.client.get(self.section(post)), '/moved/')
+
+    def test_empty_sections_are_not_found(self):
+        response = self.client.get(reverse('sitemap_section', args=[1000]))
+        self.assertEqual(response.status_code, 404)
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        for i, tag in enumerate(['music', 'music', 'tour']):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                slug=f'post-{i}',
+                author=cls.author,
+                body=f'Body {i}.',
+                status=Post.Status.PUBLISHED,
+            )
+            post.tags.add(tag)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tag_feed_only_lists_tagged_posts(self):
+        response = self.client.get(reverse('blog:post_feed_by_tag', args=['music']))
+        self.assertContains(response, 'Post 0')
+        self.assertContains(response, 'Post 1')
+        self.assertNotContains(response, 'Post 2')
+        self.assertContains(response, '/blog/tag/music/')
+        response = self.client.get(reverse('blog:post_feed_by_tag', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_polls_are_served_from_the_cache_until_a_post_changes(self):
+        url = reverse('blog:post_feed_by_tag', args=['music'])
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        post = Post.objects.create(
+            title='Fresh post',
+            slug='fresh-post',
+            author=self.author,
+            body='Fresh.',
+            status=Post.Status.PUBLISHED,
+        )
+        post.tags.add('music')
+        self.assertContains(self.client.get(url), 'Fresh post')
+        self.assertNotContains(self.client.get(reverse('blog:post_feed_by_tag', args=['tour'])), 'Fresh post')
+
+
+class GetLeadsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        post = Post.objects.create(
+            title='Post',
+            slug='post',
+            author=author,
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+        for name, email, active in [
+            ('Old Name', 'reader@example.com', True),
+            ('New Name', 'Reader@Example.com', True),
+            ('Other', 'other@example.com', True),
+            ('Hidden', 'hidden@example.com', False),
+        ]:
+            Comment.objects.create(
+                post=post,
+                name=name,
+                email=email,
+                body='Nice post.',
+                active=active,
+            )
+
+    def test_leads_are_deduplicated_keeping_the_latest_name(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('get_leads', stdout=stdout, stderr=stderr)
+        rows = list(csv.reader(StringIO(stdout.getvalue())))
+        self.assertEqual(rows, [
+            ['name', 'email'],
+            ['Other', 'other@example.com'],
+            ['New Name', 'Reader@Example.com'],
+        ])
+        self.assertIn('1 duplicate', stderr.getvalue())
+
+    def test_all_includes_hidden_comments(self):
+        stdout = StringIO()
+        with self.assertNumQueries(2):
+            call_command('get_leads', is_all=True, stdout=stdout, stderr=StringIO())
+        rows = list(csv.reader(StringIO(stdout.getvalue())))
+        self.assertEqual([email for name, email in rows[1:]], [
+            'hidden@example.com',
+            'other@example.com',
+            'Reader@Example.com',
+        ])
+
+    def test_jsonl_output_to_a_file(self):
+        with TemporaryDirectory() as directory:
+            output = Path(directory, 'leads.jsonl')
+            call_command('get_leads', format='jsonl', output=str(output), stdout=StringIO())
+            leads = [json.loads(line) for line in output.read_text().splitlines()]
+        self.assertEqual(
+            [lead['email'] for lead in leads],
+            ['other@example.com', 'Reader@Example.com']
+        )
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    failures = []
+
+    def send_messages(self, messages):
+        if self.failures:
+            raise self.failures.pop(0)
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            title='Shared post',
+            slug='shared-post',
+            author=User.objects.create_user('author'),
+            body='Body.',
+            status=Post.Status.PUBLISHED,
+        )
+
+    def share(self):
+        return self.client.post(
+            reverse('blog:post_share', args=[self.post.id]),
+            {
+                'name': 'Reader',
+                'email': 'reader@example.com',
+                'to': 'friend@example.com',
+                'comments': 'Read this.',
+            }
+        )
+
+    def test_sharing_only_enqueues_the_email(self):
+        response = self.share()
+        self.assertTrue(response.context['sent'])
+        self.assertEqual(mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, ['friend@example.com'])
+        self.assertIn('Shared post', email.subject)
+
+    def test_worker_sends_the_queue_over_one_connection(self):
+        for i in range(3):
+            self.share()
+        with patch('blog.outbox.get_connection', wraps=get_connection) as connect:
+            call_command('send_outbox', once=True, batch_size=2, stdout=StringIO())
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(
+            OutboundEmail.objects.exclude(status=OutboundEmail.Status.SENT).exists()
+        )
+
+    @override_settings(
+        EMAIL_BACKEND='blog.tests.FlakyEmailBackend',
+        BLOG_OUTBOX_MAX_ATTEMPTS=2,
+    )
+    def test_failed_sends_back_off_and_give_up(self):
+        self.share()
+        FlakyEmailBackend.failures = [
+            smtplib.SMTPServerDisconnected('gone'),
+            smtplib.SMTPRecipientsRefused({}),
+        ]
+        outbox = Outbox()
+        self.assertEqual(outbox.send_batch(), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.Status.PENDING)
+        self.assertGreater(email.next_attempt, timezone.now())
+        self.assertEqual(outbox.send_batch(), (0, 0))
+        OutboundEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(outbox.send_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.Status.FAILED)
+        self.assertIn('SMTPRecipientsRefused', email.last_error)
+
+    def test_sent_messages_are_saved_before_the_next_one(self):
+        for i in range(3):
+            self.share()
+        FlakyEmailBackend.failures = []
+        with override_settings(EMAIL_BACKEND='blog.tests.FlakyEmailBackend'):
+            outbox = Outbox()
+            sent = outbox.send
+            def crash_on_second(email):
+                if mail.outbox:
+                    raise KeyboardInterrupt
+                return sent(email)
+            with patch.object(outbox, 'send', crash_on_second), self.assertRaises(KeyboardInterrupt):
+                outbox.send_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            OutboundEmail.objects.filter(status=OutboundEmail.Status.SENT).count(), 1
+        )
+        # The rest stay leased to the crashed worker until the lease ends.
+        self.assertEqual(Outbox().send_batch(), (0, 0))
+        OutboundEmail.objects.filter(status=OutboundEmail.Status.PENDING).update(
+            next_attempt=timezone.now()
+        )
+        self.assertEqual(Outbox().send_batch(), (2, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class SeedBenchmarkTests(TestCase):
+    def test_seed_is_reproducible_and_consistent(self):
+        seeded = seed_blog(posts=30, tags=5, comments=3, seed=7)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), seeded['comments'])
+        urls = sorted(post.get_absolute_url() for post in Post.objects.all())
+        for post in Post.objects.all():
+            self.assertEqual(
+                post.active_comment_count,
+                post.comments.filter(active=True).count()
+            )
+        self.assertEqual(clear_seed(), 30)
+        self.assertFalse(Post.objects.exists())
+        seed_blog(posts=30, tags=5, comments=3, seed=7)
+        self.assertEqual(
+            sorted(post.get_absolute_url() for post in Post.objects.all()),
+            urls
+        )
+
+    def test_benchmark_measures_every_route(self):
+        seed_blog(posts=30, tags=5, comments=3)
+        routes = Benchmark('http://testserver', requests=2, warmup=0).run()
+        self.assertEqual(set(routes), {
+            'post_list',
+            'post_list_by_tag',
+            'post_detail',
+            'post_comments',
+            'post_share',
+            'post_feed',
+            'post_feed_by_tag',
+            'post_search',
+            'sitemap',
+            'sitemap_section',
+            'post_comment',
+        })
+        for name, result in routes.items():
+            self.assertGreater(result['bytes'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'], name)
+        self.assertEqual(routes['post_detail']['queries'], 1)
+
+
+@override_settings(BLOG_READ_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        # The two test databases hold different posts, the page shows which
+        # one was read.
+        for alias in ('default', 'replica'):
+            author = User.objects.db_manager(alias).create_user('author')
+            Post.objects.using(alias).create(
+                title=f'Post on {alias}',
+                slug='post',
+                author=author,
+                body='Body.',
+                status=Post.Status.PUBLISHED,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.settle()
+
+    def settle(self):
+        # As if the last change was made long ago.
+        cache.set_many({changed_key(name): 0 for name in ('posts', 'comments')}, None)
+
+    def assertReadFrom(self, alias, client=None):
+        # Drops the cached pages and fragments, not the change stamps.
+        stamps = cache.get_many([changed_key('posts'), changed_key('comments')])
+        cache.clear()
+        cache.set_many(stamps, None)
+        response = (client or self.client).get(reverse('blog:post_list'))
+        self.assertContains(response, f'Post on {alias}')
+
+    def test_reads_go_to_the_replica(self):
+        self.assertReadFrom('replica')
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client.get(reverse('blog:post_list_by_tag', args=['missing']))
+        self.assertTrue(queries)
+
+    def test_writers_are_pinned_to_the_primary(self):
+        post = Post.objects.get()
+        response = self.client.post(
+            reverse('blog:post_comment', args=[post.id]),
+            {'name': 'Reader', 'email': 'reader@example.com', 'body': 'Hi.'}
+        )
+        pin = response.cookies[settings.BLOG_REPLICA_PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.BLOG_REPLICA_PIN_SECONDS)
+        self.assertEqual(Comment.objects.using('replica').count(), 0)
+        self.assertEqual(post.comments.count(), 1)
+        self.settle()
+        self.assertReadFrom('default')
+        self.assertReadFrom('replica', Client())
+
+    def test_everyone_reads_the_primary_right_after_a_change(self):
+        Post.objects.update(title='Post on default')
+        bump_versions('posts')
+        self.assertReadFrom('default')
+        self.settle()
+        self.assertReadFrom('replica')
+
+    def test_saving_a_replica_instance_writes_to_the_primary(self):
+        token = current_replica.set('replica')
+        try:
+            post = Post.objects.get()
+        finally:
+            current_replica.reset(token)
+        self.assertEqual(post._state.db, 'replica')
+        post.title = 'Saved'
+        post.save()
+        self.assertEqual(Post.objects.using('default').get().title, 'Saved')
+        self.assertEqual(Post.objects.using('replica').get().title, 'Post on replica')
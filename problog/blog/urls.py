@@ -1,15 +1,27 @@
+from django.conf import settings
 from django.urls import path
 
-from blog import views
-from blog.feeds import LatestPostsFeed
+from blog import async_views, views
+from blog.feeds import LatestPostsFeed, TagPostsFeed, feed_condition
+
+
+# Read-only pages are served by blog.async_views under ASGI.
+if settings.BLOG_ASYNC_VIEWS:
+    pages = async_views
+    post_feed = async_views.post_feed
+    post_feed_by_tag = async_views.post_feed_by_tag
+else:
+    pages = views
+    post_feed = feed_condition(LatestPostsFeed())
+    post_feed_by_tag = feed_condition(TagPostsFeed())
 
 
 app_name = 'blog'
 urlpatterns = [
-    path('', views.post_list, name='post_list'),
+    path('', pages.post_list, name='post_list'),
     path(
         '<int:year>/<int:month>/<int:day>/<slug:post>/',
-        views.post_detail,
+        pages.post_detail,
         name='post_detail',
     ),
     path(
@@ -18,7 +30,18 @@ urlpatterns = [
         name='post_share'
     ),
     path('<int:post_id>/comment/', views.post_comment, name='post_comment'),
-    path('tag/<slug:tag_slug>/', views.post_list, name='post_list_by_tag'),
-    path('feed/', LatestPostsFeed(), name='post_feed'),
-    path('search/', views.post_search, name='post_search'),
+    path(
+        '<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path('tag/<slug:tag_slug>/', pages.post_list, name='post_list_by_tag'),
+    path(
+        'tag/<slug:tag_slug>/feed/',
+        post_feed_by_tag,
+        name='post_feed_by_tag'
+    ),
+    path('feed/', post_feed, name='post_feed'),
+    path('search/', pages.post_search, name='post_search'),
+    path('stats/', views.request_stats, name='request_stats'),
 ]
\ No newline at end of file
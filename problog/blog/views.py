@@ -1,30 +1,98 @@
 from django.shortcuts import render, get_object_or_404
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.sitemaps.views import x_robots_tag
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.http import require_POST
-from django.core.mail import send_mail
+from django.views.decorators.vary import vary_on_cookie
 from django.conf import settings
-from django.db.models import Count
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.utils.http import urlencode
 from taggit.models import Tag
 
-from blog.models import Post, Comment
+from blog.cache import cached
+from blog.conditional import (
+    post_detail_condition,
+    post_list_condition,
+    request_state,
+    sitemap_index_condition,
+    sitemap_index_state,
+    sitemap_section_condition,
+    sitemap_section_state,
+)
+from blog.models import Post, Comment, SimilarPost
+from blog.pagecache import cache_anonymous_page
 from blog.forms import EmailPostForm, CommentForm, SearchForm
+from blog.instrumentation import view_stats
+from blog.outbox import enqueue_mail
+from blog.pagination import KeysetPaginator, InvalidCursor
+from blog.search import search_posts
+from blog.sitemaps import PostSitemap
 
 
+def paginate_posts(request, post_list):
+    per_page = settings.BLOG_POSTS_PER_PAGE
+    if settings.BLOG_PAGINATION == 'keyset' and 'page' not in request.GET:
+        paginator = KeysetPaginator(
+            post_list,
+            per_page,
+            ordering=('-publish', '-id'),
+            count=settings.BLOG_PAGINATION_COUNT
+        )
+        try:
+            return paginator.page(
+                after=request.GET.get('after'),
+                before=request.GET.get('before')
+            )
+        except InvalidCursor:
+            return paginator.page()
+    paginator = Paginator(post_list, per_page)
+    page_number = request.GET.get('page', 1)
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def get_similar_posts(post):
+    return [
+        row.similar
+        for row in SimilarPost.objects.filter(
+            post=post,
+            similar__status=Post.Status.PUBLISHED
+        ).select_related('similar').only(
+            'similar__title',
+            'similar__slug',
+            'similar__publish',
+        ).order_by('rank')[:settings.BLOG_SIMILAR_POSTS]
+    ]
+
+
+def paginate_comments(comments, after=None):
+    # Oldest first, the next page seeks past the last comment shown. The
+    # related manager reads "post" on every row, it must not be deferred.
+    paginator = KeysetPaginator(
+        comments.only('post', 'name', 'body', 'created'),
+        settings.BLOG_COMMENTS_PER_PAGE,
+        ordering=('created', 'id')
+    )
+    return paginator.page(after=after)
+
+
+@post_list_condition
+@cache_anonymous_page
 def post_list(request, tag_slug=None):
-    post_list = Post.published.all()
+    post_list = Post.published.for_listing()
     tag = None
     if tag_slug:
         tag = get_object_or_404(Tag, slug=tag_slug)
         post_list = post_list.filter(tags__in=[tag])
-    paginator = Paginator(post_list, 3)
-    page_number = request.GET.get('page', 1)
-    try:
-        posts = paginator.page(page_number)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    posts = paginate_posts(request, post_list)
     return render(
         request,
         'blog/post/list.html',
@@ -35,6 +103,9 @@ def post_list(request, tag_slug=None):
     )
 
 
+@vary_on_cookie
+@post_detail_condition
+@cache_anonymous_page
 def post_detail(request, year, month, day, post):
     post = get_object_or_404(
         Post,
@@ -44,15 +115,9 @@ def post_detail(request, year, month, day, post):
         publish__day=day,
         slug=post
     )
-    comments = post.comments.filter(active=True)
+    comments = paginate_comments(post.comments.filter(active=True))
     form = CommentForm()
-    post_tags_ids = post.tags.values_list('id', flat=True)
-    similar_posts = Post.published.filter(
-        tags__in=post_tags_ids
-    ).exclude(id=post.id)
-    similar_posts = similar_posts.annotate(
-        same_tags=Count('tags')
-    ).order_by('-same_tags', '-publish')[:4]
+    similar_posts = get_similar_posts(post)
     return render(
         request,
         'blog/post/detail.html',
@@ -65,6 +130,27 @@ def post_detail(request, year, month, day, post):
     )
 
 
+def post_comments(request, post_id):
+    # Looked up by its primary key first, an id out of the database range
+    # then matches nothing instead of failing in the foreign key filter.
+    post = get_object_or_404(Post.published.only('id'), pk=post_id)
+    comments = Comment.objects.filter(post=post, active=True)
+    try:
+        comments = paginate_comments(comments, request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid comments cursor.')
+    if not comments:
+        raise Http404('No comments found.')
+    return render(
+        request,
+        'blog/post/includes/comment_list.html',
+        {
+            'post_id': post_id,
+            'comments': comments,
+        }
+    )
+
+
 def post_share(request, post_id):
     post = get_object_or_404(
         Post,
@@ -85,7 +171,7 @@ def post_share(request, post_id):
 
             Comments about this from {cd['name']}:
             "{cd["comments"]}"'''
-            send_mail(
+            enqueue_mail(
                 subject,
                 message,
                 settings.DEFAULT_FROM_EMAIL,
@@ -129,21 +215,26 @@ def post_comment(request, post_id):
     )
 
 
+def paginate_results(request, query):
+    results = search_posts(
+        Post.published.for_listing(),
+        query
+    )[:settings.BLOG_SEARCH_MAX_RESULTS]
+    paginator = Paginator(results, settings.BLOG_SEARCH_RESULTS_PER_PAGE)
+    return paginator.get_page(request.GET.get('page'))
+
+
 def post_search(request):
     form = SearchForm()
     query = None
     results = []
+    getvars = ''
     if 'query' in request.GET:
         form = SearchForm(data=request.GET)
         if form.is_valid():
             query = form.cleaned_data['query']
-            # search_vector = SearchVector('title', 'body')
-            search_vector = SearchVector('title', weight='A') + SearchVector('body', weight='B')
-            search_query = SearchQuery(query)
-            results = Post.published.annotate(
-                search=search_vector,
-                rank=SearchRank(search_vector, search_query)
-            ).filter(rank__gte=0.3).order_by('-rank')
+            results = paginate_results(request, query)
+            getvars = f'&{urlencode({"query": query})}'
     return render(
         request,
         'blog/post/search.html',
@@ -151,5 +242,61 @@ def post_search(request):
             'query': query,
             'form': form,
             'results': results,
+            'getvars': getvars,
+        }
+    )
+
+
+@staff_member_required
+def request_stats(request):
+    return render(
+        request,
+        'blog/stats.html',
+        {
+            **admin.site.each_context(request),
+            'views': view_stats.summary(),
+            'window': settings.BLOG_INSTRUMENTATION_WINDOW,
         }
-    )
\ No newline at end of file
+    )
+
+
+@x_robots_tag
+@sitemap_index_condition
+def sitemap_index(request):
+    current = request_state(request, sitemap_index_state)
+    sections = current[0] if current else []
+    domain = get_current_site(request).domain
+    sitemaps = [
+        {
+            'location': f'{request.scheme}://{domain}{reverse("sitemap_section", args=[section])}',
+            'last_mod': lastmod,
+        }
+        for section, lastmod, total in sections
+    ]
+    return render(
+        request,
+        'sitemap_index.xml',
+        {'sitemaps': sitemaps},
+        content_type='application/xml'
+    )
+
+
+@x_robots_tag
+@sitemap_section_condition
+def sitemap_section(request, section):
+    current = request_state(request, sitemap_section_state, section)
+    if current is None:
+        raise Http404(f'No sitemap available for section: {section}')
+    (lastmod, total), stamps = current
+    domain = get_current_site(request).domain
+    # Keyed by the section's latest update and size, a section is only
+    # rendered again after one of its posts changed.
+    xml = cached(
+        f'sitemap:{section}:{request.scheme}:{domain}:{lastmod.timestamp()}:{total}',
+        [],
+        lambda: render_to_string(
+            'sitemap.xml',
+            {'urlset': PostSitemap(section).section_urls(request.scheme, domain)}
+        )
+    )
+    return HttpResponse(xml, content_type='application/xml')
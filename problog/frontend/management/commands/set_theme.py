@@ -14,7 +14,7 @@ Configures the project to use the specified "theme" as the preferred CSS stylesh
         theme_path = settings.BASE_DIR / 'frontend/static/css'
         try:
             themes = os.listdir(theme_path)
-            themes = [f for f in themes if f.endswith('.css')]
+            themes = [f for f in themes if f.endswith('.min.css')]
             themes = [t.replace('.min.css', '') for t in themes]
             themes.sort()
             self.theme_choices = themes
@@ -0,0 +1,210 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MANIFEST = '.sass-manifest.json'
+# Maps each theme to its content-hashed stylesheet, read by "theme_getstatic".
+PUBLISHED_MANIFEST = 'themes.json'
+SASS_OPTIONS = ['--no-source-map', '--style=compressed']
+# Shared by every theme, an upgrade rebuilds all of them.
+DEPENDENCIES = (
+    'node_modules/bulma/package.json',
+    'node_modules/sass/package.json',
+)
+
+
+class SassNotInstalled(Exception):
+    pass
+
+
+def theme_root():
+    return settings.BASE_DIR.absolute().parent / 'themes'
+
+
+def output_root():
+    return settings.BASE_DIR / 'frontend/static/css'
+
+
+def list_themes(root):
+    try:
+        return sorted(path.name for path in Path(root).iterdir() if path.is_dir())
+    except OSError:
+        return []
+
+
+def published_themes(output_dir=None):
+    try:
+        return json.loads((Path(output_dir or output_root()) / PUBLISHED_MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def fingerprinted_name(theme, content):
+    digest = hashlib.md5(content, usedforsecurity=False).hexdigest()[:12]
+    return f'{theme}.min.{digest}.css'
+
+
+def write_file(path, data):
+    temporary = path.with_name(f'.{path.name}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def sass_executable(project_root):
+    local = Path(project_root, 'node_modules/.bin')
+    return shutil.which('sass') or shutil.which('sass', path=str(local))
+
+
+class SassBuilder:
+    # Compiles themes concurrently, each in its own sass process. A manifest
+    # of the hash of each theme's inputs skips themes that did not change.
+
+    def __init__(self, themes_dir=None, output_dir=None, jobs=None):
+        self.themes_dir = Path(themes_dir or theme_root())
+        self.output_dir = Path(output_dir or output_root())
+        self.project_root = self.themes_dir.parent
+        self.jobs = jobs or os.cpu_count() or 1
+        self.manifest_file = self.output_dir / MANIFEST
+
+    def load_manifest(self):
+        try:
+            return json.loads(self.manifest_file.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest, name=MANIFEST):
+        write_file(
+            self.output_dir / name,
+            json.dumps(manifest, indent=2, sort_keys=True).encode()
+        )
+
+    def output(self, theme):
+        return self.output_dir / f'{theme}.min.css'
+
+    def input_hash(self, theme):
+        digest = hashlib.sha256(repr(SASS_OPTIONS).encode())
+        theme_dir = self.themes_dir / theme
+        files = sorted(path for path in theme_dir.rglob('*') if path.is_file())
+        files.extend(self.project_root / name for name in DEPENDENCIES)
+        for path in files:
+            digest.update(str(path.relative_to(self.project_root)).encode() + b'\0')
+            try:
+                digest.update(path.read_bytes())
+            except OSError:
+                pass
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def compile(self, theme, executable):
+        source = self.themes_dir / theme / 'theme.scss'
+        if not source.exists():
+            return f'The "theme.scss" file is missing from "{source.parent}".'
+        output = self.output(theme)
+        # Written aside and moved into place, a failed build never replaces
+        # the previous stylesheet.
+        temporary = output.with_name(f'.{output.name}.tmp')
+        try:
+            result = subprocess.run(
+                [executable, *SASS_OPTIONS, str(source), str(temporary)],
+                capture_output=True,
+                text=True,
+                cwd=self.project_root
+            )
+        except OSError as error:
+            return f'Could not run sass: {error}'
+        if result.returncode != 0 or not temporary.exists():
+            temporary.unlink(missing_ok=True)
+            message = (result.stderr or result.stdout).strip()
+            return message or f'sass exited with status {result.returncode}.'
+        os.replace(temporary, output)
+        return None
+
+    def variants(self, name):
+        suffixes = ['', '.gz']
+        if brotli is not None:
+            suffixes.append('.br')
+        return [self.output_dir / f'{name}{suffix}' for suffix in suffixes]
+
+    def is_published(self, theme, published):
+        name = published.get(theme)
+        if name is None or not all(path.exists() for path in self.variants(name)):
+            return False
+        return name == fingerprinted_name(theme, self.output(theme).read_bytes())
+
+    def publish(self, theme):
+        # Writes the content-hashed copy of the stylesheet with its gzip and
+        # brotli siblings for nginx's "gzip_static", and drops the copies of
+        # earlier builds. Those stay in STATIC_ROOT, where collectstatic never
+        # deletes, for pages cached before the build.
+        content = self.output(theme).read_bytes()
+        name = fingerprinted_name(theme, content)
+        compressed = [
+            content,
+            gzip.compress(content, compresslevel=9, mtime=0),
+        ]
+        if brotli is not None:
+            compressed.append(brotli.compress(content, quality=11))
+        paths = self.variants(name)
+        for path, data in zip(paths, compressed):
+            write_file(path, data)
+        for path in self.output_dir.glob(f'{theme}.min.*.css*'):
+            if path not in paths:
+                path.unlink()
+        return name
+
+    def build(self, themes, force=False, publish_only=False):
+        # Returns the built themes, the skipped ones, the newly published ones
+        # and an error message for each theme that failed.
+        if not self.output_dir.is_dir():
+            raise FileNotFoundError(self.output_dir)
+        manifest = self.load_manifest()
+        hashes = {theme: self.input_hash(theme) for theme in themes}
+        pending = [
+            theme for theme in themes
+            if not publish_only and (
+                force
+                or manifest.get(theme) != hashes[theme]
+                or not self.output(theme).exists()
+            )
+        ]
+        skipped = [theme for theme in themes if theme not in pending]
+        built, errors = [], {}
+        if pending:
+            executable = sass_executable(self.project_root)
+            if executable is None:
+                raise SassNotInstalled(self.project_root)
+            with ThreadPoolExecutor(min(self.jobs, len(pending))) as pool:
+                results = pool.map(lambda theme: self.compile(theme, executable), pending)
+                for theme, error in zip(pending, results):
+                    if error is None:
+                        built.append(theme)
+                        manifest[theme] = hashes[theme]
+                    else:
+                        errors[theme] = error
+                        manifest.pop(theme, None)
+            self.save_manifest(manifest)
+        published = published_themes(self.output_dir)
+        unpublished = [
+            theme for theme in themes
+            if theme not in errors
+            and self.output(theme).exists()
+            and not self.is_published(theme, published)
+        ]
+        if unpublished:
+            with ThreadPoolExecutor(min(self.jobs, len(unpublished))) as pool:
+                published.update(zip(unpublished, pool.map(self.publish, unpublished)))
+            self.save_manifest(published, PUBLISHED_MANIFEST)
+        return built, skipped, unpublished, errors
@@ -4,9 +4,13 @@ import django
 from django import forms, template
 from django.forms import BoundField
 from django.template.loader import get_template
+from django.templatetags.static import static
 from django.utils.safestring import mark_safe
 from django.conf import settings
 
+from problog.timing import timed
+from frontend.sass import PUBLISHED_MANIFEST, output_root, published_themes
+
 
 register = template.Library()
 BULMA_COLUMN_COUNT = 1
@@ -70,6 +74,7 @@ def add_field_classes(field):
         field.field.widget.attrs['class'] = field_classes
 
 
+@timed('forms')
 def render(element, markup_classes):
     if isinstance(element, BoundField):
         add_field_classes(element)
@@ -166,18 +171,50 @@ def bulma_message_tag(tag):
     }.get(tag, tag)
 
 
-@register.simple_tag
-def theme_getstatic():
-    try:
-        dot_path = settings.BULMA_THEME_ENV_PATH
-        dot_path = Path(dot_path)
-        if not (dot_path.exists() and dot_path.is_file()):
-            raise FileNotFoundError(f'Cannot locate "{dot_path}" bulma .env file.')
-    except Exception as err:
-        return ''
-    with open(dot_path, 'r') as file:
-        theme = file.read().strip()
-    static_path = f'{settings.STATIC_URL}css/{theme}.min.css'
-    return mark_safe(static_path)
+class ThemeStylesheet:
+    # Resolves the active theme once per process and only re-reads the theme
+    # file when its modification time, or the one of the published themes
+    # manifest, changes, e.g. after "set_theme" or "run_sass".
 
+    def __init__(self):
+        self.stamp = None
+        self.mtime = None
+        self.url = ''
 
+    def resolve(self):
+        dot_path = Path(settings.BULMA_THEME_ENV_PATH)
+        try:
+            mtime = dot_path.stat().st_mtime_ns
+        except OSError:
+            return ''
+        try:
+            published_mtime = (output_root() / PUBLISHED_MANIFEST).stat().st_mtime_ns
+        except OSError:
+            published_mtime = 0
+        if (mtime, published_mtime) != self.stamp:
+            with open(dot_path, 'r') as file:
+                theme = file.read().strip()
+            self.url = self.static_url(theme)
+            self.stamp = (mtime, published_mtime)
+            self.mtime = max(self.stamp)
+        return self.url
+
+    def static_url(self, theme):
+        published = published_themes().get(theme)
+        if published:
+            # Already content-hashed by "run_sass", with the precompressed
+            # siblings nginx looks for next to this name.
+            return f'{settings.STATIC_URL}css/{published}'
+        try:
+            # Content-hashed with ManifestStaticFilesStorage.
+            return static(f'css/{theme}.min.css')
+        except ValueError:
+            return f'{settings.STATIC_URL}css/{theme}.min.css'
+
+
+theme_stylesheet = ThemeStylesheet()
+
+
+@register.simple_tag
+def theme_getstatic():
+    return mark_safe(theme_stylesheet.resolve())
@@ -0,0 +1,93 @@
+import gzip
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from frontend.sass import SassBuilder, published_themes
+from frontend.templatetags.uitags import ThemeStylesheet
+
+
+class SassBuildTests(TestCase):
+    def fake_sass(self, command, **kwargs):
+        # Writes the source path as the stylesheet, a theme named "broken"
+        # fails the way sass reports syntax errors.
+        source, output = command[-2:]
+        self.compiled.append(Path(source).parent.name)
+        if Path(source).parent.name == 'broken':
+            return subprocess.CompletedProcess(command, 65, '', 'Error: expected "}".')
+        Path(output).write_text(source)
+        return subprocess.CompletedProcess(command, 0, '', '')
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        for theme in ('dark', 'light', 'broken'):
+            (root / 'themes' / theme).mkdir(parents=True)
+            for name in ('_variables.scss', '_overrides.scss', 'theme.scss'):
+                (root / 'themes' / theme / name).write_text(f'// {theme} {name}')
+        (root / 'css').mkdir()
+        self.builder = SassBuilder(root / 'themes', root / 'css', jobs=2)
+        self.compiled = []
+        for target, value in (
+            ('frontend.sass.subprocess.run', self.fake_sass),
+            ('frontend.sass.sass_executable', lambda root: 'sass'),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_only_changed_themes_are_built(self):
+        built, skipped, published, errors = self.builder.build(['dark', 'light', 'broken'])
+        self.assertEqual(sorted(built), ['dark', 'light'])
+        self.assertEqual(skipped, [])
+        self.assertEqual(errors, {'broken': 'Error: expected "}".'})
+        self.assertFalse(self.builder.output('broken').exists())
+        self.compiled.clear()
+        (self.builder.themes_dir / 'light' / '_variables.scss').write_text('$primary: red;')
+        built, skipped, published, errors = self.builder.build(['dark', 'light', 'broken'])
+        self.assertEqual(sorted(self.compiled), ['broken', 'light'])
+        self.assertEqual(skipped, ['dark'])
+        self.compiled.clear()
+        self.builder.build(['dark'], force=True)
+        self.assertEqual(self.compiled, ['dark'])
+
+    def test_missing_output_is_rebuilt(self):
+        self.builder.build(['dark'])
+        self.builder.output('dark').unlink()
+        built, skipped, published, errors = self.builder.build(['dark'])
+        self.assertEqual(built, ['dark'])
+        self.assertTrue(self.builder.output('dark').exists())
+
+    def test_stylesheets_are_fingerprinted_and_compressed(self):
+        self.builder.build(['dark', 'light'])
+        names = published_themes(self.builder.output_dir)
+        content = self.builder.output('dark').read_bytes()
+        self.assertRegex(names['dark'], r'^dark\.min\.[0-9a-f]{12}\.css$')
+        self.assertEqual((self.builder.output_dir / names['dark']).read_bytes(), content)
+        self.assertEqual(
+            gzip.decompress((self.builder.output_dir / f'{names["dark"]}.gz').read_bytes()),
+            content
+        )
+        # Unchanged output keeps its name, a new build replaces the copies.
+        built, skipped, published, errors = self.builder.build(['dark'], publish_only=True)
+        self.assertEqual(published, [])
+        self.builder.output('dark').write_text('.button { color: red; }')
+        built, skipped, published, errors = self.builder.build(['dark'], publish_only=True)
+        self.assertEqual((built, published), ([], ['dark']))
+        renamed = published_themes(self.builder.output_dir)['dark']
+        self.assertNotEqual(renamed, names['dark'])
+        self.assertEqual(
+            sorted(path.name for path in self.builder.output_dir.glob('dark.min.*.css*')),
+            sorted(path.name for path in self.builder.variants(renamed))
+        )
+        with patch('frontend.templatetags.uitags.output_root', lambda: self.builder.output_dir), \
+                patch('frontend.templatetags.uitags.published_themes', lambda: published_themes(self.builder.output_dir)):
+            stylesheet = ThemeStylesheet()
+            theme_file = self.builder.output_dir / '.bulmatheme'
+            theme_file.write_text('dark\n')
+            with override_settings(BULMA_THEME_ENV_PATH=theme_file):
+                self.assertEqual(stylesheet.resolve(), f'/static/css/{renamed}')
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.middleware.instrumentation_middleware',
+    'blog.middleware.replica_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +60,8 @@ ROOT_URLCONF = 'problog.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Times template rendering for blog.instrumentation.
+        'BACKEND': 'blog.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -122,4 +125,70 @@ BULMA_THEME_ENV_PATH = BASE_DIR / 'problog/.bulmatheme'
 
     
 MEDIA_URL = 'media/'
-MEDIA_ROOT =  BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT =  BASE_DIR / 'media'
+
+
+# Blog
+# Markdown extensions used to pre-render post bodies. Changing this set changes
+# the render version, run the "render_markdown" command afterwards to backfill.
+
+BLOG_MARKDOWN_EXTENSIONS = []
+BLOG_MARKDOWN_EXTENSION_CONFIGS = {}
+BLOG_EXCERPT_WORDS = 30
+BLOG_POSTS_PER_PAGE = 3
+# "keyset" pages post lists with older/newer cursors, "page" keeps numbered
+# pages. Numbered "?page=" links are always honoured.
+BLOG_PAGINATION = 'keyset'
+BLOG_PAGINATION_COUNT = False
+# Cached fragments are keyed by versions bumped on every change, so the
+# timeout only bounds how long unused entries linger.
+BLOG_CACHE_TIMEOUT = 60 * 60 * 24
+BLOG_SIMILAR_POSTS = 4
+# Comments shown with a post, the rest are loaded a page at a time.
+BLOG_COMMENTS_PER_PAGE = 20
+# Tag subdomains are resolved from an in-process slug set, reloaded after
+# the TTL so tag changes made by other processes are picked up.
+BLOG_TAG_SLUG_CACHE_SIZE = 10000
+BLOG_TAG_SLUG_CACHE_TTL = 60 * 5
+BLOG_SUBDOMAIN_REDIRECT_MAX_AGE = 60 * 60 * 24
+BLOG_SEARCH_RESULTS_PER_PAGE = 10
+BLOG_SEARCH_MAX_RESULTS = 100
+# Minimum ts_rank of a Postgres match, SQLite FTS5 keeps every match.
+BLOG_SEARCH_MIN_RANK = 0.3
+# "export_static" writes the published blog here for nginx to serve, pages
+# are requested in-process as if they came from BLOG_EXPORT_URL.
+BLOG_EXPORT_ROOT = BASE_DIR / 'export'
+BLOG_EXPORT_URL = 'http://localhost'
+# "export_static --watch" exports after every post or comment change it sees
+# when polling, and at least every MAX_INTERVAL seconds.
+BLOG_EXPORT_POLL_INTERVAL = 5
+BLOG_EXPORT_MAX_INTERVAL = 60 * 5
+# Posts per sitemap section, sitemaps are limited to 50,000 URLs.
+BLOG_SITEMAP_SECTION_SIZE = 10000
+# Share emails are queued and sent by the "send_outbox" worker, a failed
+# message is retried after RETRY_DELAY seconds, doubled on every attempt.
+# Messages a worker is sending are leased for LEASE seconds.
+BLOG_OUTBOX_BATCH_SIZE = 50
+BLOG_OUTBOX_POLL_INTERVAL = 5
+BLOG_OUTBOX_MAX_ATTEMPTS = 5
+BLOG_OUTBOX_RETRY_DELAY = 60
+BLOG_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+BLOG_OUTBOX_LEASE = 60 * 5
+# Serves the post list, post pages, search and feeds from blog.async_views,
+# for the ASGI server in config/gunicorn. With PARALLEL_QUERIES the queries
+# of a page run side by side, each on a connection of its own.
+BLOG_ASYNC_VIEWS = False
+BLOG_ASYNC_PARALLEL_QUERIES = False
+# Per-request query, template, sidebar, form and Markdown timings. Staff see
+# them in a Server-Timing header, the stats page keeps the latest WINDOW
+# requests of every view in each worker process.
+BLOG_INSTRUMENTATION = True
+BLOG_INSTRUMENTATION_WINDOW = 200
+BLOG_INSTRUMENTATION_SLOW_QUERIES = 5
+# Reads of posts, comments and tags on GET requests go to one of these
+# DATABASES aliases. Clients that just wrote, and everyone right after any
+# change, stay on the primary for PIN_SECONDS.
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+BLOG_READ_REPLICAS = []
+BLOG_REPLICA_PIN_SECONDS = 10
+BLOG_REPLICA_PIN_COOKIE = 'pin_primary'
@@ -5,10 +5,16 @@ from problog.settings.base import *
 
 DEBUG = True
 SECRET_KEY = 'django-insecure-c%iy-)(bo7_=npvt+$lu+f=9!c$ojt#tq8qlwyz1i7y&zt@637'
+# "replica" opens the same file, set BLOG_READ_REPLICAS = ['replica'] to
+# route reads through it. Tests get a separate database for each alias.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
 }
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
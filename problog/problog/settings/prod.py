@@ -43,8 +43,16 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        # Kept open by every uWSGI worker and by each worker thread of the
+        # parallel async queries, which would otherwise connect per query.
+        'CONN_MAX_AGE': 60 * 5,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# Streaming replicas of "db", e.g. POSTGRES_REPLICA_HOSTS=replica1,replica2.
+for i, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica{i}'] = {**DATABASES['default'], 'HOST': host.strip()}
+BLOG_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
 SECRET_KEY = get_secret_key()
 EMAIL_HOST = os.environ.get('EMAIL_HOST')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
@@ -56,6 +64,29 @@ ADMINS = [
     ('Dylan Garrett', 'dmgarrett72@protonmail.com'),
     ('Stoney Coffelt', 'stoneycoffelt3@gmail.com'),
 ]
+# Shared by every uWSGI and ASGI worker of every container. The cache
+# versions of blog.cache are bumped with incr(), which Redis runs atomically,
+# so concurrent bumps are never lost.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://redis:6379/0'),
+    }
+}
+# collectstatic writes content-hashed copies of every asset, which nginx
+# serves with far-future cache headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+    },
+}
+BLOG_EXPORT_URL = 'https://austinoutdoorcraft.com'
+# Set by the "asgi" service of docker-compose.yml.
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS') is not None
+BLOG_ASYNC_PARALLEL_QUERIES = BLOG_ASYNC_VIEWS
 
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
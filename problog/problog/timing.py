@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+
+# Set by blog.middleware for the request being handled, any app may time
+# its work into it without depending on the blog. Timers only use its
+# enter(name) and exit(name, start) methods.
+current_timings = ContextVar('blog_request_timings', default=None)
+
+
+@contextmanager
+def timer(name):
+    # Nested timers of the same name, e.g. templates included by the form
+    # tags, only count once.
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = timings.enter(name)
+    try:
+        yield
+    finally:
+        timings.exit(name, start)
+
+
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
@@ -16,22 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.contrib.sitemaps.views import sitemap
 
-from blog.sitemaps import PostSitemap
+from blog.views import sitemap_index, sitemap_section
 
 
-sitemaps = {
-    'posts': PostSitemap,
-}
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('blog/', include('blog.urls', namespace='blog')),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
     path(
-        'sitemap.xml',
-        sitemap,
-        {'sitemaps': sitemaps},
-        name='django.contrib.sitemaps.views.sitemap'
+        'sitemap-posts-<int:section>.xml',
+        sitemap_section,
+        name='sitemap_section'
     ),
 ]